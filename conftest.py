@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def write_through(settings):
+    """Тесты проверяют запись сразу, даже при YATUBE_WRITE_BEHIND=1."""
+    settings.POSTS_WRITE_BEHIND = False
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    """
+    Дожидается фонового пула миниатюр до teardown фикстур.
+
+    Иначе пул пишет в уже удаленный временный MEDIA_ROOT и обращается к
+    базе, когда pytest-django ее уже закрыл.
+    """
+    yield
+    from posts import thumbnails
+
+    thumbnails.drain()
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import routers
+        pre_migrate.connect(routers.migrations_started)
+        post_migrate.connect(routers.migrations_finished)
+        if settings.TEMPLATES_PRECOMPILE:
+            from .templates import precompile_templates
+            precompile_templates()
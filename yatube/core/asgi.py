@@ -0,0 +1,254 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+from django.urls import Resolver404, resolve
+from django.utils.http import quote_etag
+from django.utils.module_loading import import_string
+
+from .cache import is_memory_cache
+
+PAGE_CACHE_PREFIX = 'asgi:page'
+TOO_LARGE = (
+    413, [('Content-Type', 'text/plain; charset=utf-8')],
+    ['Слишком большой запрос'.encode()]
+)
+
+
+def build_environ(scope, body):
+    """WSGI environ из HTTP scope протокола ASGI и файла с телом запроса."""
+    path = scope.get('raw_path') or scope['path'].encode('utf-8')
+    path = path.split(b'?', 1)[0].decode('latin-1')
+    root_path = scope.get('root_path', '')
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path,
+        'PATH_INFO': path[len(root_path):],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+def content_length(scope):
+    for name, value in scope.get('headers', []):
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def read_body(receive, max_size):
+    """
+    Тело запроса в файле или None, если оно больше max_size.
+
+    Тело до FILE_UPLOAD_MAX_MEMORY_SIZE остается в памяти, большее
+    SpooledTemporaryFile сбрасывает во временный файл, как это делает
+    обработчик загрузок Django.
+    """
+    body = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR
+    )
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > max_size:
+            body.close()
+            return None
+        body.write(chunk)
+        if not message.get('more_body', False):
+            break
+    body.seek(0)
+    return body
+
+
+async def send_response(send, status, headers, chunks):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ],
+    })
+    for chunk in chunks:
+        if chunk:
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': True,
+            })
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class ASGIHandler:
+    """
+    ASGI-приложение поверх обычного WSGIHandler Django.
+
+    Django 2.2 не умеет работать асинхронно, поэтому запрос целиком —
+    middleware, ORM и шаблоны — выполняется в ограниченном пуле потоков
+    ASGI_THREADS, а чтение тела и отправка ответа медленному клиенту идут
+    в цикле событий и не держат поток.
+
+    Страницы из ASGI_CACHED_VIEWS для анонимных посетителей сохраняются
+    вместе с ETag. Повторный запрос сверяет ETag по версиям из кэша и,
+    если страница не менялась, отдается без рендеринга. Проверка идет
+    прямо в цикле событий, только если кэш в памяти или в memcached:
+    файловый и табличный кэши блокировали бы цикл, и с ними проверка
+    выполняется в пуле потоков.
+    """
+
+    def __init__(self):
+        self.wsgi_handler = WSGIHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi'
+        )
+        self.etag_funcs = {
+            view_name: import_string(path)
+            for view_name, path in settings.ASGI_CACHED_VIEWS.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемый тип {scope["type"]}')
+        max_size = settings.ASGI_MAX_BODY_SIZE
+        length = content_length(scope)
+        body = None
+        if length is None or length <= max_size:
+            body = await read_body(receive, max_size)
+        if body is None:
+            return await send_response(send, *TOO_LARGE)
+        with body:
+            environ = build_environ(scope, body)
+            match = self.cacheable(environ)
+            loop = asyncio.get_running_loop()
+            if match is not None:
+                if is_memory_cache():
+                    response = self.cached_response(environ, match)
+                else:
+                    response = await loop.run_in_executor(
+                        self.executor, self.cached_response, environ, match
+                    )
+                if response is not None:
+                    return await send_response(send, *response)
+            response = await loop.run_in_executor(
+                self.executor, self.run_wsgi, environ, match
+            )
+        await send_response(send, *response)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def cacheable(self, environ):
+        """Совпадение URL, если ответ можно взять из кэша страниц."""
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return None
+        if settings.SESSION_COOKIE_NAME in environ.get('HTTP_COOKIE', ''):
+            return None
+        try:
+            match = resolve(environ['PATH_INFO'])
+        except Resolver404:
+            return None
+        if match.view_name not in self.etag_funcs:
+            return None
+        return match
+
+    def page_key(self, environ):
+        return '{}:{}?{}'.format(
+            PAGE_CACHE_PREFIX, environ['PATH_INFO'], environ['QUERY_STRING']
+        )
+
+    def cached_response(self, environ, match):
+        """Ответ из кэша страниц без обращения к базе или None."""
+        entry = cache.get(self.page_key(environ))
+        if entry is None:
+            return None
+        request = WSGIRequest(environ)
+        request.user = AnonymousUser()
+        request.cache_only = True
+        etag = self.etag_funcs[match.view_name](
+            request, *match.args, **match.kwargs
+        )
+        if etag is None or quote_etag(etag) != entry['etag']:
+            return None
+        if entry['etag'] in environ.get('HTTP_IF_NONE_MATCH', ''):
+            return 304, [('ETag', entry['etag'])], []
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return 200, entry['headers'], []
+        return 200, entry['headers'], [entry['body']]
+
+    def run_wsgi(self, environ, match):
+        """
+        Выполняет запрос в потоке пула и читает тело ответа там же.
+
+        Потоковые ответы (ленты Atom и JSON) собираются целиком, пока у
+        потока есть соединение с базой; их размер ограничен числом постов
+        в ленте.
+        """
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        result = self.wsgi_handler(environ, start_response)
+        try:
+            chunks = list(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        status, headers = started['status'], started['headers']
+        if match is not None and status == 200:
+            self.store(environ, headers, b''.join(chunks))
+        return status, headers, chunks
+
+    def store(self, environ, headers, body):
+        names = {name.lower(): value for name, value in headers}
+        if 'etag' not in names or 'set-cookie' in names:
+            return
+        cache.set(
+            self.page_key(environ),
+            {'etag': names['etag'], 'headers': headers, 'body': body},
+            settings.ASGI_PAGE_CACHE_TIMEOUT
+        )
@@ -0,0 +1,153 @@
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+
+_MISSING = object()
+
+
+class TwoTierCache(BaseCache):
+    """
+    Кэш из двух уровней: L1 в памяти процесса и общий для воркеров L2.
+
+    Чтения сначала идут в L1, записи и удаления — в оба уровня. Время жизни
+    записи в L1 ограничено L1_TIMEOUT, поэтому изменения из других процессов
+    видны не позже чем через это время.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        self.l1 = LocMemCache(location or 'two-tier', {
+            'TIMEOUT': self.l1_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000)},
+        })
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self.l1.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            value = self.l2.get(key, _MISSING, version=version)
+            if value is _MISSING:
+                return default
+            self.l1.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self.l1.get_many(keys, version=version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self.l2.get_many(missing, version=version)
+            self.l1.set_many(shared, version=version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self.l1.set(key, value, self._l1_timeout(timeout), version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        self.l1.set_many(data, self._l1_timeout(timeout), version=version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self.l1.set(
+                key, value, self._l1_timeout(timeout), version=version
+            )
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        # Сбрасывается только свой L1: другие процессы увидят новое
+        # значение (например, версию ленты) не позже чем через L1_TIMEOUT.
+        value = self.l2.incr(key, delta, version=version)
+        self.l1.delete(key, version=version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def has_key(self, key, version=None):
+        return (
+            self.l1.has_key(key, version=version)
+            or self.l2.has_key(key, version=version)
+        )
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version=version)
+        self.l2.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.l1.delete_many(keys, version=version)
+        self.l2.delete_many(keys, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+
+def is_memory_cache(backend=None):
+    """
+    Хранит ли кэш данные в памяти: процесса или memcached.
+
+    Для TwoTierCache это определяет L2. Файловый и табличный кэши Django
+    ходят на диск и в базу.
+    """
+    backend = caches['default'] if backend is None else backend
+    if isinstance(backend, TwoTierCache):
+        backend = backend.l2
+    return isinstance(backend, (LocMemCache, BaseMemcachedCache))
+
+
+def has_atomic_incr(backend=None):
+    """
+    Атомарны ли incr и add у кэша.
+
+    В памяти процесса и в memcached — да; файловый и табличный кэши
+    Django делают incr как get и set, и одновременные изменения теряются.
+    """
+    return is_memory_cache(backend)
+
+
+def get_or_set_locked(key, default, timeout=DEFAULT_TIMEOUT,
+                      lock_timeout=10, poll_interval=0.05):
+    """
+    cache.get_or_set с защитой от одновременного пересчета.
+
+    Значение вычисляет только процесс, захвативший блокировку через
+    cache.add; остальные ждут его результат не дольше lock_timeout.
+    """
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, lock_timeout):
+        try:
+            value = default()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if not cache.has_key(lock_key):
+            break
+    return default()
@@ -0,0 +1,33 @@
+from django.db.backends.sqlite3 import base
+
+from core.db.pool import PooledDatabaseWrapperMixin
+
+# Режим WAL позволяет читать параллельно с записью; остальные настройки
+# снижают число fsync и ожидают блокировку вместо ошибки
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    SQLite с пулом соединений и PRAGMA из настройки PRAGMAS.
+
+    PRAGMA выполняются один раз при создании соединения, а не при каждой
+    выдаче из пула. Для базы в памяти (тесты) пул не используется:
+    закрытие последнего соединения уничтожило бы базу.
+    """
+
+    def pool_enabled(self):
+        return super().pool_enabled() and not self.is_in_memory_db()
+
+    def create_connection(self, conn_params):
+        raw_connection = super().create_connection(conn_params)
+        pragmas = self.settings_dict.get('PRAGMAS', DEFAULT_PRAGMAS)
+        for name, value in pragmas.items():
+            raw_connection.execute(f'PRAGMA {name} = {value}')
+        return raw_connection
@@ -0,0 +1,134 @@
+import collections
+import functools
+import threading
+import time
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def close_quietly(raw_connection):
+    try:
+        raw_connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """
+    Пул открытых соединений DB-API одной базы.
+
+    Соединение берется из пула вместо установки нового и возвращается
+    в него вместо закрытия. Слишком старые соединения пересоздаются,
+    а давно простаивавшие перед выдачей проверяются запросом SELECT 1.
+    """
+
+    def __init__(self, size=10, max_lifetime=600, health_check_after=30):
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.idle = collections.deque()
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def acquire(self, connect):
+        """Пара (соединение, время создания)."""
+        while True:
+            with self.lock:
+                item = self.idle.pop() if self.idle else None
+            if item is None:
+                self.stats['created'] += 1
+                return connect(), time.monotonic()
+            raw_connection, created, released = item
+            now = time.monotonic()
+            if now - created >= self.max_lifetime:
+                self.stats['recycled'] += 1
+                close_quietly(raw_connection)
+                continue
+            if (now - released >= self.health_check_after
+                    and not self.is_healthy(raw_connection)):
+                self.stats['unhealthy'] += 1
+                close_quietly(raw_connection)
+                continue
+            self.stats['reused'] += 1
+            return raw_connection, created
+
+    def release(self, raw_connection, created):
+        now = time.monotonic()
+        with self.lock:
+            if (len(self.idle) < self.size
+                    and now - created < self.max_lifetime):
+                self.idle.append((raw_connection, created, now))
+                return
+        close_quietly(raw_connection)
+
+    def is_healthy(self, raw_connection):
+        try:
+            cursor = raw_connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, collections.deque()
+        for raw_connection, _, _ in idle:
+            close_quietly(raw_connection)
+
+
+def get_pool(alias, settings_dict):
+    """Общий для всех потоков пул базы из настройки POOL."""
+    key = (alias, settings_dict['NAME'])
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**settings_dict['POOL'])
+        return _pools[key]
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Примесь к DatabaseWrapper бэкенда Django: соединения берутся из пула.
+
+    Пул включается ключом POOL в настройках базы (параметры
+    ConnectionPool). Закрытие соединения Django — по CONN_MAX_AGE или
+    в конце запроса — возвращает его в пул, так что установка соединения
+    не попадает в время ответа. Соединение, закрываемое посреди
+    транзакции, в пул не возвращается.
+    """
+
+    def pool_enabled(self):
+        return bool(self.settings_dict.get('POOL'))
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def create_connection(self, conn_params):
+        """Новое соединение в обход пула."""
+        return super().get_new_connection(conn_params)
+
+    def get_new_connection(self, conn_params):
+        self.pool_created = None
+        if not self.pool_enabled():
+            return self.create_connection(conn_params)
+        raw_connection, self.pool_created = self.pool.acquire(
+            functools.partial(self.create_connection, conn_params)
+        )
+        return raw_connection
+
+    def _close(self):
+        # Соединение могло быть открыто до включения пула: например,
+        # к тестовой базе в памяти, имя которой потом заменено обратно
+        if (getattr(self, 'pool_created', None) is None
+                or self.connection is None or self.in_atomic_block):
+            return super()._close()
+        try:
+            self.connection.rollback()
+        except Exception:
+            close_quietly(self.connection)
+            return
+        self.pool.release(self.connection, self.pool_created)
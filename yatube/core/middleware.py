@@ -0,0 +1,112 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import routers, stats
+
+
+class QueryTimer:
+    """execute_wrapper, который считает запросы и время в базе."""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+class RequestStatsMiddleware:
+    """
+    Замеряет запросы к базе, время в базе и в шаблонах и размер ответа.
+
+    Итоги отдаются в заголовке Server-Timing и копятся для страницы
+    статистики. При REQUEST_STATS_ENABLED = False middleware отключается
+    при старте и не добавляет накладных расходов.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_STATS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timers = {}
+        stats.start_request()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                timers[connection.alias] = QueryTimer()
+                stack.enter_context(
+                    connection.execute_wrapper(timers[connection.alias])
+                )
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        template = stats.template_time()
+        duration = sum(timer.duration for timer in timers.values())
+        queries = sum(timer.queries for timer in timers.values())
+        by_alias = {
+            alias: timer.queries
+            for alias, timer in timers.items() if timer.queries
+        }
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={duration * 1000:.2f};desc="{queries} q"',
+        ] + [
+            f'db-{alias};dur={timers[alias].duration * 1000:.2f};'
+            f'desc="{count} q"'
+            for alias, count in by_alias.items()
+        ] + [
+            f'tpl;dur={template * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        match = request.resolver_match
+        if match is not None:
+            stats.record(
+                match.view_name,
+                total=total * 1000,
+                db=duration * 1000,
+                queries=queries,
+                template=template * 1000,
+                size=0 if response.streaming else len(response.content),
+            )
+            stats.record_aliases(match.view_name, by_alias)
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Закрепляет клиента за основной базой после записи.
+
+    Запрос, который что-то записал, ставит cookie на REPLICA_PIN_SECONDS:
+    пока она есть, чтение идет с основной базы и клиент видит свои
+    изменения несмотря на отставание реплик. Без реплик отключается.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset(
+            pinned=settings.REPLICA_PIN_COOKIE in request.COOKIES
+            or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        )
+        try:
+            response = self.get_response(request)
+            if routers.wrote():
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS, httponly=True
+                )
+        finally:
+            routers.reset()
+        return response
@@ -0,0 +1,62 @@
+import random
+import threading
+
+from django.conf import settings
+
+_state = threading.local()
+# Пока идут миграции, на репликах может не быть их таблиц
+_migrating = threading.Event()
+
+
+def reset(pinned=False):
+    """Начало запроса: чтение с реплик, если клиент не закреплен."""
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def migrations_started(**kwargs):
+    """Обработчик pre_migrate: чтение переключается на основную базу."""
+    _migrating.set()
+
+
+def migrations_finished(**kwargs):
+    _migrating.clear()
+
+
+class ReplicaRouter:
+    """
+    Чтение с реплик из DATABASE_REPLICAS, запись — в default.
+
+    После первой записи чтение до конца запроса идет с основной базы,
+    чтобы не прочитать с реплики еще не доехавшие изменения. Между
+    запросами клиента закрепляет ReplicaPinningMiddleware. Во время
+    migrate все чтение идет с основной базы.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or is_pinned() or _migrating.is_set():
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = True
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
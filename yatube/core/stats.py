@@ -0,0 +1,126 @@
+import threading
+from collections import Counter, defaultdict, deque
+
+from django.conf import settings
+
+_local = threading.local()
+_lock = threading.Lock()
+_samples = defaultdict(
+    lambda: deque(maxlen=settings.REQUEST_STATS_WINDOW)
+)
+_alias_queries = defaultdict(Counter)
+_template_samples = defaultdict(
+    lambda: deque(maxlen=settings.REQUEST_STATS_WINDOW)
+)
+
+METRICS = ('total', 'db', 'queries', 'template', 'size')
+
+
+def start_request():
+    _local.template_time = 0.0
+    _local.template_depth = 0
+
+
+def template_started():
+    if hasattr(_local, 'template_depth'):
+        _local.template_depth += 1
+
+
+def template_finished(duration):
+    """Учитывает время только внешних шаблонов, без вложенных include."""
+    if not hasattr(_local, 'template_depth'):
+        return
+    _local.template_depth -= 1
+    if _local.template_depth == 0:
+        _local.template_time += duration
+
+
+def template_time():
+    return getattr(_local, 'template_time', 0.0)
+
+
+def template_entered():
+    if not hasattr(_local, 'template_stack'):
+        _local.template_stack = []
+    _local.template_stack.append(0.0)
+
+
+def template_exited(template_name, duration):
+    """
+    Замер одного шаблона: полное время и собственное, без вложенных
+    include и родителя из extends.
+    """
+    children = _local.template_stack.pop()
+    if _local.template_stack:
+        _local.template_stack[-1] += duration
+    with _lock:
+        _template_samples[template_name].append(
+            (duration * 1000, (duration - children) * 1000)
+        )
+
+
+def record(view_name, **sample):
+    with _lock:
+        _samples[view_name].append(sample)
+
+
+def record_aliases(view_name, queries):
+    """Копит число запросов страницы к каждой базе (основной и репликам)."""
+    with _lock:
+        _alias_queries[view_name].update(queries)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _alias_queries.clear()
+        _template_samples.clear()
+
+
+def percentile(values, fraction):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, int(round(fraction * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summary():
+    """p50/p95/p99 каждой метрики и запросы по базам по имени URL."""
+    with _lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+        aliases = {
+            name: dict(counts) for name, counts in _alias_queries.items()
+        }
+    result = {}
+    for name, samples in snapshot.items():
+        result[name] = {
+            'count': len(samples),
+            'queries_by_alias': aliases.get(name, {}),
+        }
+        for metric in METRICS:
+            values = [sample[metric] for sample in samples]
+            result[name][metric] = {
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+            }
+    return result
+
+
+def template_summary():
+    """p50/p95/p99 полного и собственного времени каждого шаблона."""
+    with _lock:
+        snapshot = {
+            name: list(samples) for name, samples in _template_samples.items()
+        }
+    result = {}
+    for name, samples in snapshot.items():
+        result[name] = {'count': len(samples)}
+        for index, metric in enumerate(('total', 'self')):
+            values = [sample[index] for sample in samples]
+            result[name][metric] = {
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+            }
+    return result
@@ -0,0 +1,31 @@
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import (
+    DjangoTemplates, Template, reraise
+)
+
+from . import stats
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats.template_started()
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_finished(time.perf_counter() - start)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django, который замеряет время рендеринга."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
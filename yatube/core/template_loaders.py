@@ -0,0 +1,37 @@
+import time
+
+from django.template.base import Template
+from django.template.loaders import cached
+
+from . import stats
+
+
+class ProfiledTemplate(Template):
+    """Шаблон, который сообщает в stats время каждого рендеринга."""
+
+    def _render(self, context):
+        stats.template_entered()
+        start = time.perf_counter()
+        try:
+            return super()._render(context)
+        finally:
+            stats.template_exited(
+                self.origin.template_name or self.name,
+                time.perf_counter() - start
+            )
+
+
+class ProfilingLoader(cached.Loader):
+    """
+    Кэширующий загрузчик, шаблоны которого замеряют свой рендеринг.
+
+    Замеряются и шаблоны из include и extends, так что в статистике видно
+    время каждого подключаемого куска страницы.
+    """
+
+    def get_template(self, template_name, skip=None):
+        template = super().get_template(template_name, skip)
+        # Базовый загрузчик создает обычный Template; класс подменяется
+        # один раз, дальше из кэша приходит уже ProfiledTemplate
+        template.__class__ = ProfiledTemplate
+        return template
@@ -0,0 +1,38 @@
+import os
+
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.utils import get_app_template_dirs
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt', '.xml')
+
+
+def template_names(directories):
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                if file_name.endswith(TEMPLATE_EXTENSIONS):
+                    path = os.path.join(root, file_name)
+                    yield os.path.relpath(path, directory).replace(
+                        os.sep, '/'
+                    )
+
+
+def precompile_templates():
+    """
+    Загружает все шаблоны проекта и приложений в кэширующий загрузчик.
+
+    Первый запрос после старта не тратит время на разбор шаблонов, а
+    синтаксическая ошибка в любом шаблоне видна сразу при запуске.
+    Возвращает число загруженных шаблонов.
+    """
+    total = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        directories = list(backend.engine.dirs)
+        directories += get_app_template_dirs('templates')
+        for name in sorted(set(template_names(directories))):
+            backend.engine.get_template(name)
+            total += 1
+    return total
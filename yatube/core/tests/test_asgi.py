@@ -0,0 +1,144 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.asgi import ASGIHandler, read_body
+from posts.models import Post
+
+User = get_user_model()
+
+
+def call(application, path, method='GET', headers=(), body=b''):
+    """Один запрос к ASGI-приложению: статус, заголовки и тело."""
+    response = {'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': body}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = dict(message['headers'])
+        else:
+            response['body'] += message.get('body', b'')
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'testserver')] + list(headers),
+    }
+    asyncio.run(application(scope, receive, send))
+    return response
+
+
+class ASGIHandlerTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='asgi_author')
+        self.post = Post.objects.create(author=self.author, text='Пост ASGI')
+        self.application = ASGIHandler()
+        self.addCleanup(self.application.executor.shutdown)
+
+    def test_renders_through_thread_pool(self):
+        response = call(self.application, reverse('posts:index'))
+        self.assertEqual(response['status'], 200)
+        self.assertIn('Пост ASGI', response['body'].decode())
+
+    def test_cached_page_skips_thread_pool(self):
+        """Неизменившаяся страница отдается из кэша без потока и базы"""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        first = call(self.application, url)
+        with mock.patch.object(self.application, 'run_wsgi') as run_wsgi:
+            with self.assertNumQueries(0):
+                second = call(self.application, url)
+            run_wsgi.assert_not_called()
+        self.assertEqual(second['body'], first['body'])
+        etag = first['headers'][b'ETag']
+        not_modified = call(
+            self.application, url, headers=[(b'if-none-match', etag)]
+        )
+        self.assertEqual(not_modified['status'], 304)
+
+    def test_blocking_cache_checked_in_thread_pool(self):
+        """С файловым кэшем ETag сверяется в пуле, а не в цикле событий"""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        threads = []
+        cached_response = self.application.cached_response
+
+        def record(*args):
+            threads.append(threading.current_thread().name)
+            return cached_response(*args)
+
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        with self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}):
+            call(self.application, url)
+            with mock.patch.object(
+                self.application, 'cached_response', side_effect=record
+            ):
+                response = call(self.application, url)
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('asgi'))
+
+    def test_changes_invalidate_cached_page(self):
+        url = reverse('posts:index')
+        call(self.application, url)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = call(self.application, url)
+        self.assertIn('Новый пост', response['body'].decode())
+
+    def test_sessions_and_writes_bypass_cache(self):
+        url = reverse('posts:index')
+        call(self.application, url)
+        with mock.patch.object(
+            self.application, 'run_wsgi',
+            wraps=self.application.run_wsgi
+        ) as run_wsgi:
+            call(self.application, url,
+                 headers=[(b'cookie', b'sessionid=abc')])
+            call(self.application, reverse('posts:post_create'),
+                 method='POST')
+        self.assertEqual(run_wsgi.call_count, 2)
+
+    @override_settings(ASGI_MAX_BODY_SIZE=100)
+    def test_large_body_rejected(self):
+        """Тело больше предела получает 413 без обращения к Django"""
+        with mock.patch.object(self.application, 'run_wsgi') as run_wsgi:
+            declared = call(
+                self.application, reverse('posts:post_create'), 'POST',
+                headers=[(b'content-length', b'1000')]
+            )
+            streamed = call(
+                self.application, reverse('posts:post_create'), 'POST',
+                body=b'x' * 101
+            )
+            run_wsgi.assert_not_called()
+        self.assertEqual(declared['status'], 413)
+        self.assertEqual(streamed['status'], 413)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_body_spooled_to_disk(self):
+        """Тело больше FILE_UPLOAD_MAX_MEMORY_SIZE пишется во временный файл"""
+        messages = [
+            {'type': 'http.request', 'body': b'x' * 8, 'more_body': True},
+            {'type': 'http.request', 'body': b'y' * 8},
+        ]
+
+        async def receive():
+            return messages.pop(0)
+
+        body = asyncio.run(read_body(receive, 100))
+        with body:
+            self.assertTrue(body._rolled)
+            self.assertEqual(body.read(), b'x' * 8 + b'y' * 8)
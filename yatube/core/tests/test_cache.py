@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+import threading
+
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+
+from core.cache import get_or_set_locked
+
+SHARED_DIR = tempfile.mkdtemp()
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': 60},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SHARED_DIR,
+    },
+})
+class TwoTierCacheTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(SHARED_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+
+    def test_reads_are_served_from_process_memory(self):
+        """Запись попадает в оба уровня, чтение идет из L1"""
+        self.cache.set('key', 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.shared.delete('key')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_l1_is_filled_from_shared_cache(self):
+        """Значение, записанное другим воркером, читается из L2"""
+        self.shared.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        self.assertEqual(self.cache.l1.get('a'), 1)
+
+    def test_delete_and_incr_reach_both_levels(self):
+        """Удаление и инкремент не оставляют устаревших данных в L1"""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter'), 2)
+        self.assertEqual(self.cache.get('counter'), 2)
+        self.cache.delete('counter')
+        self.assertIsNone(self.cache.get('counter'))
+        self.assertIsNone(self.shared.get('counter'))
+
+
+class GetOrSetLockedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_value_is_computed_once(self):
+        """Значение вычисляется при промахе и затем берется из кэша"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'page'
+
+        self.assertEqual(get_or_set_locked('hot', compute), 'page')
+        self.assertEqual(get_or_set_locked('hot', compute), 'page')
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_for_lock_holder(self):
+        """Пока значение считает другой воркер, запрос ждет его результат"""
+        cache.add('hot:lock', True)
+        timer = threading.Timer(0.1, cache.set, args=('hot', 'ready'))
+        timer.start()
+
+        def compute():
+            raise AssertionError('значение не должно пересчитываться')
+
+        self.assertEqual(get_or_set_locked('hot', compute), 'ready')
+        timer.join()
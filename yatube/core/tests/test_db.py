@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from core.db.backends.sqlite3.base import DatabaseWrapper
+
+
+class PooledSQLiteTest(SimpleTestCase):
+    """Пул на файловой базе SQLite: тестовая база в памяти пул не включает."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = dict(
+            connection.settings_dict,
+            NAME=os.path.join(directory, 'pool.sqlite3'),
+            POOL={'size': 2, 'max_lifetime': 600, 'health_check_after': 0},
+        )
+        settings_dict.pop('PRAGMAS', None)
+        self.wrapper = DatabaseWrapper(settings_dict, alias='pool_test')
+        self.addCleanup(self.wrapper.pool.close_all)
+        self.addCleanup(self.wrapper.close)
+
+    def reconnect(self):
+        self.wrapper.close()
+        self.wrapper.ensure_connection()
+        return self.wrapper.connection
+
+    def test_closed_connection_is_reused(self):
+        self.wrapper.ensure_connection()
+        raw_connection = self.wrapper.connection
+        self.assertIs(self.reconnect(), raw_connection)
+        self.assertEqual(self.wrapper.pool.stats['created'], 1)
+
+    def test_pragmas_applied(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_broken_connection_replaced(self):
+        """Соединение, не прошедшее проверку, заменяется новым"""
+        self.wrapper.ensure_connection()
+        raw_connection = self.wrapper.connection
+        self.wrapper.close()
+        raw_connection.close()
+        self.wrapper.ensure_connection()
+        self.assertIsNot(self.wrapper.connection, raw_connection)
+        self.assertEqual(self.wrapper.pool.stats['unhealthy'], 1)
+
+    def test_old_connection_recycled(self):
+        self.wrapper.ensure_connection()
+        raw_connection = self.wrapper.connection
+        with mock.patch.dict(self.wrapper.pool.__dict__, max_lifetime=0):
+            self.assertIsNot(self.reconnect(), raw_connection)
@@ -0,0 +1,52 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import stats
+
+User = get_user_model()
+
+TIMED_TEMPLATES = copy.deepcopy(settings.TEMPLATES)
+TIMED_TEMPLATES[0]['BACKEND'] = 'core.template_backends.TimedDjangoTemplates'
+
+
+@override_settings(REQUEST_STATS_ENABLED=True, TEMPLATES=TIMED_TEMPLATES)
+class RequestStatsMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+
+    def test_server_timing_header(self):
+        """Ответ содержит время базы, шаблонов и общее время"""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'total;dur='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, timing)
+
+    def test_stats_aggregated_per_url_name(self):
+        """Статистика собирается по имени URL и доступна персоналу"""
+        for _ in range(3):
+            self.client.get(reverse('posts:index'))
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        client = Client()
+        client.force_login(staff)
+        data = client.get(reverse('core:request_stats')).json()
+        self.assertEqual(data['posts:index']['count'], 3)
+        self.assertGreater(data['posts:index']['template']['p50'], 0)
+        self.assertGreater(data['posts:index']['size']['p99'], 0)
+
+    def test_stats_hidden_from_guests(self):
+        response = self.client.get(reverse('core:request_stats'))
+        self.assertEqual(response.status_code, 302)
+
+
+class RequestStatsDisabledTest(TestCase):
+    def test_middleware_not_used_when_disabled(self):
+        """Отключенная статистика не добавляет заголовков"""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -0,0 +1,148 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import (
+    Client, SimpleTestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+
+from core import routers, stats
+from posts.models import Post
+
+User = get_user_model()
+
+TIMED_TEMPLATES = copy.deepcopy(settings.TEMPLATES)
+TIMED_TEMPLATES[0]['BACKEND'] = 'core.template_backends.TimedDjangoTemplates'
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica'], REQUEST_STATS_ENABLED=True,
+    TEMPLATES=TIMED_TEMPLATES
+)
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Реплика — второе соединение с той же тестовой базой, поэтому запросы
+    к ней видны по алиасу, а данные совпадают с основной базой.
+    """
+
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        default = connections['default'].settings_dict
+        connections.databases['replica'] = dict(
+            default, POOL=None, TEST=dict(default['TEST'], MIRROR='default')
+        )
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections.databases['replica']
+        del connections._connections.replica
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        self.author = User.objects.create_user(username='replica_author')
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def tearDown(self):
+        routers.reset()
+
+    def queries_by_alias(self, response):
+        return {
+            part.split(';')[0]: part
+            for part in response['Server-Timing'].split(', ')
+        }
+
+    def test_reads_go_to_replica(self):
+        response = Client().get(reverse('posts:index'))
+        timing = self.queries_by_alias(response)
+        self.assertIn('db-replica', timing)
+        self.assertNotIn('db-default', timing)
+
+    def test_write_pins_client_to_primary(self):
+        """После записи чтение идет с основной базы, пока есть cookie"""
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'}
+        )
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        response = self.client.get(reverse('posts:index'))
+        timing = self.queries_by_alias(response)
+        self.assertIn('db-default', timing)
+        self.assertNotIn('db-replica', timing)
+        self.assertTrue(Post.objects.filter(text='Новый пост').exists())
+
+    def test_pin_expires_with_cookie(self):
+        self.client.post(reverse('posts:post_create'), {'text': 'Пост'})
+        del self.client.cookies[settings.REPLICA_PIN_COOKIE]
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertIn('db-replica', self.queries_by_alias(response))
+
+    def test_stats_count_queries_per_alias(self):
+        Client().get(reverse('posts:index'))
+        summary = stats.summary()['posts:index']
+        self.assertGreater(summary['queries_by_alias']['replica'], 0)
+
+    def test_routing_without_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(
+                routers.ReplicaRouter().db_for_read(Post), 'default'
+            )
+
+
+@override_settings(DATABASE_REPLICAS=['fresh_replica'])
+class MigrateWithReplicasTest(SimpleTestCase):
+    """migrate новой базы при реплике, на которой еще нет таблиц."""
+
+    databases = {'fresh', 'fresh_replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        default = connections['default'].settings_dict
+        for alias in cls.databases:
+            connections.databases[alias] = dict(
+                default, POOL=None, TEST={},
+                NAME=os.path.join(cls.directory, f'{alias}.sqlite3')
+            )
+        connections.databases['fresh_replica']['PRAGMAS'] = {
+            'query_only': 'ON'
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.databases:
+            connections[alias].close()
+            del connections.databases[alias]
+            delattr(connections._connections, alias)
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def test_migrate_reads_from_migrated_database(self):
+        call_command('migrate', database='fresh', verbosity=0)
+        with connections['fresh'].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM posts_follow')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_reads_stay_on_primary_during_migrate(self):
+        routers.reset()
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'fresh_replica')
+        routers.migrations_started()
+        try:
+            self.assertEqual(router.db_for_read(Post), 'default')
+        finally:
+            routers.migrations_finished()
+        self.assertEqual(router.db_for_read(Post), 'fresh_replica')
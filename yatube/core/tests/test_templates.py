@@ -0,0 +1,78 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import engines
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import stats
+from core.templates import precompile_templates
+from posts.models import Post
+
+User = get_user_model()
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+PROFILED_TEMPLATES = copy.deepcopy(settings.TEMPLATES)
+PROFILED_TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('core.template_loaders.ProfilingLoader', LOADERS)
+]
+CACHED_TEMPLATES = copy.deepcopy(settings.TEMPLATES)
+CACHED_TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', LOADERS)
+]
+
+
+@override_settings(TEMPLATES=PROFILED_TEMPLATES)
+class TemplateProfilingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        Post.objects.create(author=cls.author, text='Пост для профиля')
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+
+    def test_includes_timed_separately(self):
+        """Время страницы, родителя и каждого include замеряется отдельно"""
+        self.client.get(reverse('posts:index'))
+        summary = stats.template_summary()
+        for name in ('posts/index.html', 'base.html',
+                     'posts/includes/post_card.html'):
+            with self.subTest(name=name):
+                self.assertIn(name, summary)
+                self.assertGreater(summary[name]['total']['p50'], 0)
+        page = summary['posts/index.html']['total']['p50']
+        card = summary['posts/includes/post_card.html']
+        self.assertLessEqual(card['self']['p50'], card['total']['p50'])
+        self.assertLessEqual(card['total']['p50'], page)
+
+    def test_template_stats_for_staff(self):
+        self.client.get(reverse('posts:index'))
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        client = Client()
+        client.force_login(staff)
+        data = client.get(reverse('core:template_stats')).json()
+        self.assertIn('posts/index.html', data)
+        guest = self.client.get(reverse('core:template_stats'))
+        self.assertEqual(guest.status_code, 302)
+
+
+@override_settings(TEMPLATES=CACHED_TEMPLATES)
+class PrecompileTemplatesTest(TestCase):
+    def test_all_templates_loaded_into_cache(self):
+        """Все шаблоны попадают в кэширующий загрузчик при прогреве"""
+        total = precompile_templates()
+        # Псевдоним движка зависит от BACKEND: с YATUBE_REQUEST_STATS
+        # это не 'django', а 'template_backends'
+        backend, = engines.all()
+        loader = backend.engine.template_loaders[0]
+        self.assertGreater(total, 0)
+        for name in ('posts/index.html', 'posts/includes/post_card.html'):
+            with self.subTest(name=name):
+                self.assertIn(name, loader.get_template_cache)
@@ -1,6 +1,7 @@
 from django.contrib import admin
 # Из модуля models импортируем модель Post
 from .models import Post, Group, Comment
+from .search import filter_matching
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -15,6 +16,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу вместо LIKE '%...%' по всей таблице постов
+        if not search_term:
+            return queryset, False
+        return filter_matching(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("title",)}
@@ -32,6 +39,16 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ('created',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Индекс сужает выборку до постов, в комментариях которых есть
+        # слова запроса, а точное совпадение проверяется уже среди них
+        if not search_term:
+            return queryset, False
+        return super().get_search_results(
+            request, filter_matching(queryset, search_term, 'post_id'),
+            search_term
+        )
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
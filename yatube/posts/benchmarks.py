@@ -0,0 +1,262 @@
+import asyncio
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client, RequestFactory
+from django.urls import reverse
+
+from core.asgi import ASGIHandler
+from core.stats import percentile
+from .counters import create_missing_profiles, reconcile_counters
+from .feed import backfill_feed
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+BENCHMARK_PREFIX = 'bench_'
+
+
+def seed(users, groups, posts, comments, follows, batch_size=1000):
+    """Наполняет базу заданными объемами данных для замеров."""
+    User.objects.bulk_create(
+        (User(username=f'{BENCHMARK_PREFIX}{i}') for i in range(users)),
+        batch_size=batch_size
+    )
+    Group.objects.bulk_create(
+        (
+            Group(title=f'Группа {i}', slug=f'{BENCHMARK_PREFIX}{i}',
+                  description='Группа для замеров')
+            for i in range(groups)
+        ),
+        batch_size=batch_size
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith=BENCHMARK_PREFIX
+    ).values_list('pk', flat=True))
+    group_ids = list(Group.objects.filter(
+        slug__startswith=BENCHMARK_PREFIX
+    ).values_list('pk', flat=True)) or [None]
+    Post.objects.bulk_create(
+        (
+            Post(text=f'Пост для замеров {i}',
+                 author_id=user_ids[i % len(user_ids)],
+                 group_id=group_ids[i % len(group_ids)])
+            for i in range(posts)
+        ),
+        batch_size=batch_size
+    )
+    post_ids = list(Post.objects.values_list('pk', flat=True)[:posts])
+    Comment.objects.bulk_create(
+        (
+            Comment(text=f'Комментарий {i}',
+                    post_id=post_ids[i % len(post_ids)],
+                    author_id=user_ids[i % len(user_ids)])
+            for i in range(comments if post_ids else 0)
+        ),
+        batch_size=batch_size
+    )
+    pairs = {
+        (user_ids[i % len(user_ids)], user_ids[(i + 1) % len(user_ids)])
+        for i in range(follows)
+    }
+    Follow.objects.bulk_create(
+        (Follow(user_id=user, author_id=author)
+         for user, author in pairs if user != author),
+        batch_size=batch_size
+    )
+    for user, author in pairs:
+        if user != author:
+            backfill_feed(user, author)
+    create_missing_profiles(batch_size)
+    reconcile_counters()
+    cache.clear()
+
+
+def benchmark_targets():
+    """URL для замеров: (имя, метод, адрес, данные формы)."""
+    post = Post.objects.order_by('pk').first()
+    group = Group.objects.filter(slug__startswith=BENCHMARK_PREFIX).first()
+    return [
+        ('index', 'get', reverse('posts:index'), None),
+        ('group_posts', 'get',
+         reverse('posts:group_list', args=[group.slug]), None),
+        ('profile', 'get',
+         reverse('posts:profile', args=[post.author.username]), None),
+        ('post_detail', 'get',
+         reverse('posts:post_detail', args=[post.pk]), None),
+        ('follow_index', 'get', reverse('posts:follow_index'), None),
+        ('post_create', 'post', reverse('posts:post_create'),
+         {'text': 'Пост из замера'}),
+    ]
+
+
+def summarize(latencies, elapsed):
+    """Сводка по задержкам в миллисекундах и пропускная способность."""
+    return {
+        'requests': len(latencies),
+        'mean': statistics.mean(latencies),
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def measure(send, requests):
+    send()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        start = time.perf_counter()
+        send()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def login_client(user):
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def run_client(user, requests):
+    """Замеры через тестовый клиент Django, без сетевого стека."""
+    client = login_client(user)
+    results = {}
+    for name, method, url, data in benchmark_targets():
+        send = getattr(client, method)
+        results[name] = measure(lambda: send(url, data), requests)
+    return results
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def run_wsgi_server(user, requests):
+    """Замеры GET-страниц через локальный WSGI-сервер."""
+    server = make_server('127.0.0.1', 0, WSGIHandler(),
+                         handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    session = login_client(user).cookies['sessionid'].value
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+    results = {}
+    try:
+        for name, method, url, data in benchmark_targets():
+            if method != 'get':
+                continue
+            request = urllib.request.Request(
+                base_url + url, headers={'Cookie': f'sessionid={session}'}
+            )
+
+            def send():
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            results[name] = measure(send, requests)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def anonymous_targets():
+    return [
+        (name, url) for name, method, url, data in benchmark_targets()
+        if method == 'get' and name != 'follow_index'
+    ]
+
+
+def run_wsgi_slow_clients(requests, delay):
+    """
+    Одновременные анонимные запросы медленных клиентов к WSGI.
+
+    Как и у WSGI-сервера с пулом потоков, поток занят, пока клиент
+    не дочитает ответ, поэтому задержка клиента ест пропускную способность.
+    """
+    handler = WSGIHandler()
+    factory = RequestFactory()
+
+    def serve(url):
+        start = time.perf_counter()
+        result = handler(factory.get(url).environ, lambda *args: None)
+        try:
+            for _ in result:
+                time.sleep(delay)
+        finally:
+            result.close()
+        return (time.perf_counter() - start) * 1000
+
+    results = {}
+    with ThreadPoolExecutor(settings.ASGI_THREADS) as executor:
+        for name, url in anonymous_targets():
+            serve(url)
+            started = time.perf_counter()
+            latencies = list(executor.map(serve, [url] * requests))
+            results[name] = summarize(
+                latencies, time.perf_counter() - started
+            )
+    return results
+
+
+def run_asgi_slow_clients(requests, delay):
+    """
+    Те же медленные клиенты через ASGIHandler: поток пула освобождается
+    сразу после рендеринга, а ожидание клиента идет в цикле событий.
+    """
+    application = ASGIHandler()
+
+    async def serve(url):
+        start = time.perf_counter()
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': url,
+            'query_string': b'', 'headers': [(b'host', b'testserver')],
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message.get('body'):
+                await asyncio.sleep(delay)
+
+        await application(scope, receive, send)
+        return (time.perf_counter() - start) * 1000
+
+    async def serve_all(url):
+        return await asyncio.gather(*(serve(url) for _ in range(requests)))
+
+    results = {}
+    try:
+        for name, url in anonymous_targets():
+            asyncio.run(serve(url))
+            started = time.perf_counter()
+            latencies = asyncio.run(serve_all(url))
+            results[name] = summarize(
+                latencies, time.perf_counter() - started
+            )
+    finally:
+        application.executor.shutdown(wait=True)
+    return results
+
+
+def compare(current, previous):
+    """Изменение p50 в процентах относительно прошлого запуска."""
+    changes = {}
+    for transport, endpoints in current.items():
+        for name, result in endpoints.items():
+            old = previous.get(transport, {}).get(name)
+            if old and old['p50']:
+                changes[f'{transport}:{name}'] = (
+                    (result['p50'] - old['p50']) / old['p50'] * 100
+                )
+    return changes
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, Profile
+
+User = get_user_model()
+
+
+def change_counter(queryset, field, delta):
+    """
+    Атомарно меняет счетчик одним UPDATE с F().
+
+    Уменьшение не уводит счетчик ниже нуля: расхождение, если оно
+    появилось, исправит reconcile_counters.
+    """
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_profile_counter(user_id, field, delta):
+    change_counter(Profile.objects.filter(user_id=user_id), field, delta)
+
+
+def change_group_counter(group_id, delta):
+    if group_id is not None:
+        change_counter(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post_counter(post_id, delta):
+    change_counter(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def count_of(model, field, outer='pk'):
+    """Подзапрос с числом строк model, ссылающихся на внешнюю строку."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef(outer)}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def counters():
+    """Денормализованные счетчики: (модель, поле, фактическое значение)."""
+    return [
+        (Post, 'comments_count', count_of(Comment, 'post')),
+        (Group, 'posts_count', count_of(Post, 'group')),
+        (Profile, 'posts_count', count_of(Post, 'author', 'user_id')),
+        (Profile, 'followers_count', count_of(Follow, 'author', 'user_id')),
+        (Profile, 'following_count', count_of(Follow, 'user', 'user_id')),
+    ]
+
+
+def create_missing_profiles(batch_size=1000):
+    """Профили для пользователей, созданных в обход сигналов."""
+    missing = User.objects.filter(
+        profile__isnull=True
+    ).values_list('pk', flat=True)
+    profiles = [Profile(user_id=pk) for pk in missing.iterator()]
+    Profile.objects.bulk_create(
+        profiles, batch_size=batch_size, ignore_conflicts=True
+    )
+    return len(profiles)
+
+
+def reconcile_counters(dry_run=False):
+    """
+    Сверяет счетчики с фактическим числом строк.
+
+    Пересчитываются только разошедшиеся строки, поэтому на больших
+    таблицах запись идет точечно. Возвращает число исправлений по полям.
+    """
+    fixed = {}
+    for model, field, actual in counters():
+        stale = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).values_list('pk', 'actual')
+        name = f'{model._meta.model_name}.{field}'
+        fixed[name] = 0
+        for pk, value in stale.iterator():
+            if not dry_run:
+                model.objects.filter(pk=pk).update(**{field: value})
+            fixed[name] += 1
+    return fixed
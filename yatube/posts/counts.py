@@ -0,0 +1,173 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from core.cache import has_atomic_incr
+
+
+def feed_cache_key(kind, feed, pk=None):
+    """Ключ кэша для ленты: all, group, author или follow."""
+    if pk is None:
+        return f'posts:{kind}:{feed}'
+    return f'posts:{kind}:{feed}:{pk}'
+
+
+def feed_count_key(feed, pk=None):
+    return feed_cache_key('count', feed, pk)
+
+
+def feed_version_key(feed, pk=None):
+    return feed_cache_key('version', feed, pk)
+
+
+def feed_modified_key(version_key):
+    """Ключ времени последнего изменения ленты рядом с ключом ее версии."""
+    return version_key.replace(':version:', ':modified:', 1)
+
+
+def feed_modified(feed, pk=None):
+    """
+    Время последнего изменения ленты как timestamp.
+
+    Записывается вместе со сменой версии, поэтому учитывает и правки, и
+    удаления постов. Если ключ вытеснен из кэша, временем изменения
+    считается текущий момент: клиент один раз перечитает ленту, но не
+    получит 304 на устаревшие данные.
+    """
+    key = feed_modified_key(feed_version_key(feed, pk))
+    cache.add(key, time.time(), None)
+    return cache.get(key) or time.time()
+
+
+def _new_version():
+    # Версия от времени, чтобы после вытеснения ключа из кэша не вернуться
+    # к номеру, под которым уже лежат старые данные.
+    return int(time.time() * 1000)
+
+
+def feed_version(feed, pk=None):
+    """Версия ленты: меняется при любом изменении ее постов."""
+    return cache.get_or_set(feed_version_key(feed, pk), _new_version, None)
+
+
+def feed_versions(keys):
+    """Версии нескольких лент одним чтением кэша, недостающие создаются."""
+    versions = cache.get_many(keys)
+    missing = {
+        key: _new_version() for key in keys if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def bump_feed_versions(keys):
+    """
+    Меняет версии лент после коммита.
+
+    До коммита читатель мог бы закэшировать страницу под новой версией со
+    старыми данными. На кэше без атомарного incr два одновременных
+    увеличения дали бы одну версию, поэтому там записывается новая
+    случайная версия. В TwoTierCache другие процессы видят новую версию
+    не позже чем через L1_TIMEOUT.
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: _apply_versions(keys))
+
+
+def _apply_versions(keys):
+    now = time.time()
+    cache.set_many({feed_modified_key(key): now for key in keys}, None)
+    if not has_atomic_incr():
+        cache.set_many({
+            key: _new_version() * 1000 + random.randrange(1000)
+            for key in keys
+        }, None)
+        return
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def approximate_count(model):
+    """
+    Оценка числа строк без сканирования таблицы.
+
+    PostgreSQL отдает статистику планировщика, остальные базы — максимальный
+    первичный ключ, который читается из индекса. После удалений оценка
+    больше настоящего числа строк, и последние страницы ленты бывают
+    пустыми: это плата за отказ от COUNT(*).
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return row[0]
+    return model.objects.aggregate(count=Max('pk'))['count'] or 0
+
+
+def cached_count(queryset, count_key, approximate=False):
+    """Число объектов ленты из кэша; при промахе считается и кэшируется."""
+    count = cache.get(count_key)
+    if count is None:
+        if approximate:
+            count = approximate_count(queryset.model)
+        else:
+            count = queryset.count()
+        cache.set(count_key, count, settings.POSTS_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берет число объектов из кэша вместо COUNT(*)."""
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 approximate=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.approximate = approximate
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return super().count
+        return cached_count(
+            self.object_list, self.count_key, self.approximate
+        )
+
+
+def change_counts(keys, delta):
+    """
+    Инкрементально меняет закэшированные счетчики лент после коммита.
+
+    Откаченная транзакция счетчики не трогает. На кэше без атомарного
+    incr одновременные изменения потерялись бы, поэтому там счетчики
+    удаляются и пересчитываются при следующем запросе.
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: _apply_counts(keys, delta))
+
+
+def _apply_counts(keys, delta):
+    if not has_atomic_incr():
+        cache.delete_many(keys)
+        return
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Счетчика нет в кэше: он будет посчитан при первом запросе.
+            pass
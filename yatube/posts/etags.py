@@ -0,0 +1,84 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .counts import feed_cache_key, feed_version
+from .models import Group, Post
+
+User = get_user_model()
+
+
+def page_etag(request, *versions):
+    """
+    ETag страницы из версий ее данных.
+
+    Страница зависит и от пользователя (шапка, кнопки подписки и
+    редактирования), и от номера страницы или курсора, поэтому они тоже
+    входят в ETag. POSTS_ETAG_RELEASE сбрасывает все ETag при выкладке
+    новых шаблонов.
+    """
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    parts = (
+        settings.POSTS_ETAG_RELEASE, user_id, request.get_full_path()
+    ) + versions
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def cached_lookup(request, kind, key, queryset, field):
+    """
+    Первичный ключ объекта страницы по адресу для проверки ETag.
+
+    Соответствие кэшируется: после переименования группы или удаления
+    объекта версия ленты все равно меняется, и устаревший ключ не дает
+    ложного 304. Если у запроса выставлен cache_only (ASGI-обработчик
+    проверяет ETag прямо в цикле событий), при промахе кэша возвращается
+    None вместо запроса в базу.
+    """
+    cache_key = feed_cache_key('lookup', kind, key)
+    value = cache.get(cache_key)
+    if value is None and not getattr(request, 'cache_only', False):
+        value = queryset.values_list(field, flat=True).first()
+        if value is not None:
+            cache.set(cache_key, value, settings.POSTS_COUNT_CACHE_TIMEOUT)
+    return value
+
+
+def index_etag(request):
+    return page_etag(request, feed_version('all'))
+
+
+def group_etag(request, slug):
+    group_id = cached_lookup(
+        request, 'group', slug, Group.objects.filter(slug=slug), 'pk'
+    )
+    if group_id is None:
+        return None
+    return page_etag(request, group_id, feed_version('group', group_id))
+
+
+def profile_etag(request, username):
+    author_id = cached_lookup(
+        request, 'author', username,
+        User.objects.filter(username=username), 'pk'
+    )
+    if author_id is None:
+        return None
+    return page_etag(
+        request, author_id, feed_version('author', author_id),
+        feed_version('groups')
+    )
+
+
+def post_etag(request, post_id):
+    author_id = cached_lookup(
+        request, 'post', post_id,
+        Post.objects.filter(pk=post_id), 'author_id'
+    )
+    if author_id is None:
+        return None
+    return page_etag(
+        request, feed_version('post', post_id),
+        feed_version('author', author_id), feed_version('groups')
+    )
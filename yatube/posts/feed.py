@@ -0,0 +1,122 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .counts import (
+    feed_cache_key, feed_count_key, feed_version_key, feed_versions
+)
+from .models import FeedEntry, Follow, Post, Profile
+
+
+def is_pull_author(author_id):
+    """
+    Посты автора читаются в ленты при запросе, а не рассылаются.
+
+    Режим включается, когда подписчиков становится больше
+    FEED_FANOUT_MAX_FOLLOWERS, и остается навсегда: посты, опубликованные
+    в нем, и подписчики, пришедшие в нем, не попали в таблицу лент и
+    пропали бы из них после отписок.
+    """
+    if Profile.objects.filter(user_id=author_id, feed_pull=True).exists():
+        return True
+    followers = Follow.objects.filter(author_id=author_id).count()
+    if followers <= settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return False
+    Profile.objects.filter(user_id=author_id).update(feed_pull=True)
+    return True
+
+
+def fan_out_post(post):
+    """Добавляет новый пост в ленты всех подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post=post) for user_id in followers),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """
+    Переносит последние посты автора в ленту нового подписчика.
+
+    Переносятся только FEED_BACKFILL_SIZE последних постов: более старые
+    посты автора новый подписчик видит в его профиле, а не в ленте.
+    """
+    if is_pull_author(author_id):
+        return
+    post_ids = Post.objects.filter(
+        author_id=author_id
+    ).order_by('-pub_date').values_list('pk', flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id)
+            for post_id in post_ids[:settings.FEED_BACKFILL_SIZE]
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def trim_feed(user_id, author_id):
+    """Удаляет посты автора из ленты отписавшегося пользователя."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def follow_feed(user):
+    """
+    Посты ленты подписок пользователя.
+
+    Посты обычных авторов читаются из материализованной ленты, а посты
+    авторов с огромным числом подписчиков подтягиваются при чтении.
+    """
+    pull_authors = Follow.objects.filter(
+        user=user, author__profile__feed_pull=True
+    ).values('author_id')
+    entries = FeedEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=entries) | Q(author__in=pull_authors)
+    )
+
+
+def following_key(user_id):
+    return feed_cache_key('following', 'authors', user_id)
+
+
+def follow_count_key(user_id):
+    """
+    Ключ счетчика ленты подписок пользователя.
+
+    В ключ входят авторы, на которых он подписан, и версии их постов.
+    Новый или удаленный пост меняет версию одного автора вместо сброса
+    счетчиков всех его подписчиков, а подписка и отписка меняют список
+    авторов.
+    """
+    author_ids = cache.get(following_key(user_id))
+    if author_ids is None:
+        author_ids = list(Follow.objects.filter(
+            user_id=user_id
+        ).order_by('author_id').values_list('author_id', flat=True))
+        cache.set(
+            following_key(user_id), author_ids,
+            settings.POSTS_COUNT_CACHE_TIMEOUT
+        )
+    keys = [
+        feed_version_key('author-posts', author_id)
+        for author_id in author_ids
+    ]
+    versions = feed_versions(keys)
+    state = ':'.join(
+        f'{author_id}={versions[key]}'
+        for author_id, key in zip(author_ids, keys)
+    )
+    digest = hashlib.md5(state.encode()).hexdigest()
+    return feed_count_key('follow', f'{user_id}:{digest}')
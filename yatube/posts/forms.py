@@ -1,5 +1,6 @@
 from django.forms import ModelForm
 
+from .images import process_upload
 from .models import Post, Comment
 
 
@@ -8,6 +9,9 @@ class PostForm(ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        return process_upload(self.cleaned_data['image'])
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,19 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+POST_CARD_FRAGMENT = 'post_card'
+# Значения параметра card в posts/includes/post_card.html
+POST_CARD_VARIANTS = ('index', 'group', 'profile', 'follow')
+
+
+def post_card_keys(post_ids):
+    return [
+        make_template_fragment_key(POST_CARD_FRAGMENT, [post_id, variant])
+        for post_id in post_ids
+        for variant in POST_CARD_VARIANTS
+    ]
+
+
+def invalidate_post_cards(post_ids):
+    """Сбрасывает закэшированные карточки постов во всех лентах."""
+    cache.delete_many(post_card_keys(post_ids))
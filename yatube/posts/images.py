@@ -0,0 +1,150 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+from sorl.thumbnail import default, get_thumbnail
+
+from .thumbnails import thumbnail_specs
+
+MIME_TYPES = {
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+}
+# Анимацию не перекодируем: Pillow сохранил бы только первый кадр
+KEEP_ORIGINAL_FORMATS = ('GIF',)
+
+
+def read_header(file):
+    """
+    Формат и размер картинки из заголовка файла.
+
+    Image.open читает только заголовок, пиксели не декодируются, поэтому
+    проверка не зависит от размера картинки.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            return image.format, image.size
+    finally:
+        file.seek(0)
+
+
+def validate_upload(file):
+    if file.size > settings.POSTS_IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s МБ.',
+            code='file_too_large',
+            params={'limit': settings.POSTS_IMAGE_MAX_BYTES // 2 ** 20}
+        )
+    _, (width, height) = read_header(file)
+    if width * height > settings.POSTS_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)s×%(height)s слишком большая.',
+            code='image_too_large',
+            params={'width': width, 'height': height}
+        )
+
+
+def downscale_master(file):
+    """
+    Копия загрузки не больше POSTS_IMAGE_MASTER_SIZE по длинной стороне.
+
+    JPEG декодируется сразу в уменьшенном масштабе через draft, ориентация
+    из EXIF применяется к пикселям, а сами метаданные не сохраняются.
+    Картинки с прозрачностью сохраняются в PNG, остальные — в JPEG.
+    """
+    image_format, _ = read_header(file)
+    if image_format in KEEP_ORIGINAL_FORMATS:
+        return file
+    limit = settings.POSTS_IMAGE_MASTER_SIZE
+    with Image.open(file) as image:
+        image.draft('RGB', (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+            output_format, extension = 'PNG', 'png'
+            options = {'optimize': True}
+        else:
+            output_format, extension = 'JPEG', 'jpg'
+            image = image.convert('RGB')
+            options = {
+                'quality': settings.POSTS_IMAGE_QUALITY,
+                'optimize': True,
+                'progressive': True,
+            }
+        buffer = io.BytesIO()
+        image.save(buffer, output_format, **options)
+    name = os.path.splitext(os.path.basename(file.name))[0]
+    return ContentFile(buffer.getvalue(), name=f'{name}.{extension}')
+
+
+def process_upload(file):
+    """Проверяет новую загрузку и возвращает уменьшенную копию для записи."""
+    if not isinstance(file, UploadedFile):
+        return file
+    validate_upload(file)
+    return downscale_master(file)
+
+
+def resolve_variants(images):
+    """
+    Готовые адаптивные варианты картинок: {имя: {формат: [(url, ширина)]}}.
+
+    Записи всех миниатюр читаются из kvstore одним пакетом. Для еще не
+    созданных вариантов вызывается обычный get_thumbnail: он ставит
+    миниатюру в фоновый пул и отдает исходный файл, который в srcset не
+    попадает — иначе браузеру обещалась бы ширина, которой у файла нет.
+    """
+    specs = thumbnail_specs()
+    requests = [
+        (image, geometry_string, dict(options))
+        for image in images
+        for geometry_string, options in specs
+    ]
+    thumbnails = default.backend.lookup_many(requests)
+    variants = {image.name: {} for image in images}
+    for (image, geometry_string, options), thumbnail in zip(
+        requests, thumbnails
+    ):
+        if thumbnail is None:
+            thumbnail = get_thumbnail(image, geometry_string, **options)
+            if thumbnail.name == image.name:
+                continue
+        image_format = options.get('format', 'JPEG')
+        variants[image.name].setdefault(image_format, []).append(
+            (thumbnail.url, thumbnail.width)
+        )
+    for image_variants in variants.values():
+        for candidates in image_variants.values():
+            candidates.sort(key=lambda candidate: candidate[1])
+    return variants
+
+
+def prefetch_image_variants(posts):
+    """
+    Варианты картинок всех постов страницы одним чтением kvstore.
+
+    Результат сохраняется в post.image_variants, откуда его берет тег
+    responsive_image. Возвращает посты списком.
+    """
+    posts = list(posts)
+    variants = resolve_variants([post.image for post in posts if post.image])
+    for post in posts:
+        post.image_variants = variants.get(post.image.name, {})
+    return posts
+
+
+def image_variants(image):
+    """Варианты картинки: заранее выбранные для страницы или по запросу."""
+    prefetched = getattr(
+        getattr(image, 'instance', None), 'image_variants', None
+    )
+    if prefetched is not None:
+        return prefetched
+    return resolve_variants([image])[image.name]
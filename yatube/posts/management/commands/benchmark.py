@@ -0,0 +1,126 @@
+import json
+import os
+import subprocess
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts import benchmarks
+
+User = get_user_model()
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return time.strftime('%Y%m%d-%H%M%S')
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет отдельную тестовую базу и замеряет задержки и '
+        'пропускную способность основных страниц'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--groups', type=int, default=5)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=200)
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Число замеров на каждую страницу'
+        )
+        parser.add_argument(
+            '--no-server', action='store_true',
+            help='Не замерять через локальный WSGI-сервер'
+        )
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Число одновременных медленных клиентов для сравнения '
+                 'WSGI и ASGI, 0 — не замерять'
+        )
+        parser.add_argument(
+            '--client-delay', type=float, default=50,
+            help='Сколько миллисекунд медленный клиент читает ответ'
+        )
+        parser.add_argument(
+            '--output',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks.json'),
+            help='Файл с результатами для сравнения между коммитами'
+        )
+        parser.add_argument('--label', default=None)
+
+    def handle(self, *args, **options):
+        label = options['label'] or current_commit()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            benchmarks.seed(
+                options['users'], max(options['groups'], 1),
+                options['posts'], options['comments'], options['follows']
+            )
+            user = User.objects.filter(follower__isnull=False).first()
+            results = {
+                'client': benchmarks.run_client(user, options['requests'])
+            }
+            if not options['no_server']:
+                results['wsgi'] = benchmarks.run_wsgi_server(
+                    user, options['requests']
+                )
+            if options['slow_clients']:
+                delay = options['client_delay'] / 1000
+                results['wsgi_slow'] = benchmarks.run_wsgi_slow_clients(
+                    options['slow_clients'], delay
+                )
+                results['asgi_slow'] = benchmarks.run_asgi_slow_clients(
+                    options['slow_clients'], delay
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.report(results)
+        self.store(options['output'], label, options, results)
+
+    def report(self, results):
+        for transport, endpoints in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(transport))
+            for name, result in endpoints.items():
+                self.stdout.write(
+                    '{:<14} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  '
+                    'p99 {p99:8.2f} ms  {rps:8.1f} req/s'.format(
+                        name, **result
+                    )
+                )
+
+    def store(self, path, label, options, results):
+        history = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                history = json.load(file)
+        previous = list(history.values())[-1] if history else None
+        history.pop(label, None)
+        history[label] = {
+            'timestamp': time.time(),
+            'volumes': {
+                key: options[key]
+                for key in ('users', 'groups', 'posts', 'comments',
+                            'follows', 'requests', 'slow_clients',
+                            'client_delay')
+            },
+            'results': results,
+        }
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(history, file, indent=2, ensure_ascii=False)
+        if previous:
+            changes = benchmarks.compare(results, previous['results'])
+            for name, change in changes.items():
+                self.stdout.write(f'{name:<26} p50 {change:+7.1f}%')
@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.feed import follow_feed
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import ORDER_COUNT
+
+User = get_user_model()
+
+
+def feed_queries():
+    """Запросы списков из posts/views.py с параметрами из базы."""
+    group = Group.objects.first() or Group(pk=0)
+    user = User.objects.first() or User(pk=0)
+    post = Post.objects.first() or Post(pk=0)
+    return {
+        'index': Post.objects.select_related('group', 'author'),
+        'group_posts': group.posts.all(),
+        'profile': Post.objects.filter(author=user),
+        'follow_index': follow_feed(user),
+        'following': Follow.objects.filter(user=user, author=user),
+        'followers': Follow.objects.filter(author=user).values('user_id'),
+        'post_comments': Comment.objects.filter(post=post),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Печатает планы выполнения запросов для лент постов'
+
+    def handle(self, *args, **options):
+        for name, queryset in feed_queries().items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset[:ORDER_COUNT].explain())
@@ -0,0 +1,56 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково выгружает группы, посты, комментарии и подписки в файлы '
+        'JSONL или CSV, по файлу на модель'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default='jsonl'
+        )
+        parser.add_argument(
+            '--models', nargs='+', choices=list(transfer.MODELS),
+            default=list(transfer.MODELS)
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число моделей, выгружаемых одновременно'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать заново, не продолжая с контрольной точки'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        directory = options['directory']
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        os.makedirs(directory, exist_ok=True)
+        checkpoint = transfer.Checkpoint(
+            os.path.join(directory, '.export-checkpoint.json')
+        )
+        if options['restart']:
+            checkpoint.remove()
+            checkpoint.state = {}
+        totals = transfer.run_stage(
+            transfer.export_model, options['models'], options['workers'],
+            directory, options['format'], options['batch_size'],
+            checkpoint, self.progress
+        )
+        checkpoint.remove()
+        for name, total in totals.items():
+            self.stdout.write(f'{name}: выгружено {total}')
+
+    def progress(self, name, total):
+        if self.verbosity:
+            self.stdout.write(f'{name}: {total}')
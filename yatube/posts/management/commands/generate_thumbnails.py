@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import Post
+from posts.thumbnails import (
+    generate_in_worker, generate_thumbnail, thumbnail_specs
+)
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие миниатюры картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число потоков генерации, 0 — в текущем потоке'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько миниатюр ставить в пул за раз'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        posts = Post.objects.exclude(image='').only('pk', 'image')
+        jobs = (
+            (post.image.name, geometry_string, dict(thumbnail_options))
+            for post in posts.iterator()
+            for geometry_string, thumbnail_options in thumbnail_specs()
+        )
+        total = 0
+        if options['workers']:
+            # Пул получает миниатюры пачками: очередь задач не растет с
+            # числом постов, а следующая пачка ждет окончания предыдущей
+            with ThreadPoolExecutor(options['workers']) as executor:
+                while True:
+                    batch = list(islice(jobs, options['batch_size']))
+                    if not batch:
+                        break
+                    wait([
+                        executor.submit(generate_in_worker, *job)
+                        for job in batch
+                    ])
+                    total += len(batch)
+        else:
+            for job in jobs:
+                generate_thumbnail(*job)
+                total += 1
+        self.stdout.write(f'Обработано миниатюр: {total}')
@@ -0,0 +1,69 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково загружает файлы export_data через bulk_create. '
+        'Пользователи должны уже существовать (loaddata или миграция).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default='jsonl'
+        )
+        parser.add_argument(
+            '--models', nargs='+', choices=list(transfer.MODELS),
+            default=list(transfer.MODELS)
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число независимых моделей, загружаемых одновременно'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать заново, не продолжая с контрольной точки'
+        )
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать ленты подписок, поиск и кэш'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Нет каталога {directory}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        checkpoint = transfer.Checkpoint(
+            os.path.join(directory, '.import-checkpoint.json')
+        )
+        if options['restart']:
+            checkpoint.remove()
+            checkpoint.state = {}
+        totals = {}
+        with transfer.original_dates():
+            for stage in transfer.IMPORT_STAGES:
+                names = [name for name in stage if name in options['models']]
+                if names:
+                    totals.update(transfer.run_stage(
+                        transfer.import_model, names, options['workers'],
+                        directory, options['format'], options['batch_size'],
+                        checkpoint, self.progress
+                    ))
+        transfer.reset_sequences(totals)
+        if not options['skip_derived']:
+            transfer.rebuild_derived()
+        checkpoint.remove()
+        for name, total in totals.items():
+            self.stdout.write(f'{name}: загружено {total}')
+
+    def progress(self, name, total):
+        if self.verbosity:
+            self.stdout.write(f'{name}: {total}')
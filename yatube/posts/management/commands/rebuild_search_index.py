@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов и комментариев'
+
+    def handle(self, *args, **options):
+        total = rebuild_index()
+        self.stdout.write(
+            f'Проиндексировано постов: {total} ({search_backend()})'
+        )
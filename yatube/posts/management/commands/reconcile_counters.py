@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import create_missing_profiles, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счетчики постов, комментариев и '
+        'подписок с данными и исправляет расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if not dry_run:
+            created = create_missing_profiles()
+            self.stdout.write(f'Создано профилей: {created}')
+        fixed = reconcile_counters(dry_run=dry_run)
+        for name, count in fixed.items():
+            self.stdout.write(f'{name}: расхождений {count}')
@@ -0,0 +1,62 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_feed_entries(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    Post = apps.get_model('posts', 'Post')
+    db = schema_editor.connection.alias
+    for follow in Follow.objects.using(db).iterator():
+        post_ids = Post.objects.using(db).filter(
+            author_id=follow.author_id
+        ).order_by('-pub_date').values_list('pk', flat=True)
+        FeedEntry.objects.using(db).bulk_create(
+            (
+                FeedEntry(user_id=follow.user_id, post_id=post_id)
+                for post_id in post_ids[:settings.FEED_BACKFILL_SIZE]
+            ),
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_follow'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'verbose_name': 'Комментарий', 'verbose_name_plural': 'Комментарии'},
+        ),
+        migrations.AlterModelOptions(
+            name='group',
+            options={'verbose_name': 'Группа', 'verbose_name_plural': 'Группы'},
+        ),
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ('pub_date',), 'verbose_name': 'Пост', 'verbose_name_plural': 'Посты'},
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'unique_together': {('user', 'post')},
+            },
+        ),
+        migrations.RunPython(
+            backfill_feed_entries, migrations.RunPython.noop
+        ),
+    ]
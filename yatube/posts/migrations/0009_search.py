@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(
+            'CREATE VIRTUAL TABLE posts_search '
+            'USING fts5(text, comments, tokenize=unicode61)'
+        )
+        cursor.execute(
+            'INSERT INTO posts_search (rowid, text, comments) '
+            'SELECT posts_post.id, posts_post.text, '
+            "COALESCE(GROUP_CONCAT(posts_comment.text, char(10)), '') "
+            'FROM posts_post LEFT OUTER JOIN posts_comment '
+            'ON posts_comment.post_id = posts_post.id '
+            'GROUP BY posts_post.id'
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+            options={
+                'verbose_name': 'Слово индекса',
+                'verbose_name_plural': 'Слова индекса',
+                'unique_together': {('term', 'post')},
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
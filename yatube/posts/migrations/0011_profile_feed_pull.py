@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pull_authors(apps, schema_editor):
+    Profile = apps.get_model('posts', 'Profile')
+    Profile.objects.using(schema_editor.connection.alias).filter(
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).update(feed_pull=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='feed_pull',
+            field=models.BooleanField(default=False, help_text='Включается, когда подписчиков становится слишком много, и больше не выключается', verbose_name='Посты читаются в ленты подписчиков при запросе'),
+        ),
+        migrations.RunPython(mark_pull_authors, migrations.RunPython.noop),
+    ]
@@ -8,6 +8,7 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
 
     def __str__(self) -> str:
         return self.title
@@ -17,6 +18,19 @@ class Group(models.Model):
         verbose_name_plural = 'Группы'
 
 
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Посты для лент: автор и группа читаются тем же запросом."""
+        return self.select_related('author', 'group')
+
+    def for_detail(self):
+        """
+        Пост для отдельной страницы с профилем автора и его счетчиками.
+        Комментарии загружаются порциями через utils.comments_page.
+        """
+        return self.for_listing().select_related('author__profile')
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста', help_text='Введите текст поста'
@@ -42,6 +56,11 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
@@ -49,7 +68,18 @@ class Post(models.Model):
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
-        ordering = ('pub_date',)
+        ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_feed_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_feed_idx'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -72,6 +102,12 @@ class Comment(models.Model):
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        ordering = ('created',)
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -83,3 +119,71 @@ class Follow(models.Model):
         User, on_delete=models.CASCADE,
         related_name="following"
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_idx'),
+        ]
+
+
+class Profile(models.Model):
+    """Счетчики пользователя, которые обновляются сигналами при записи."""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        related_name="profile"
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Число подписок', default=0
+    )
+    feed_pull = models.BooleanField(
+        'Посты читаются в ленты подписчиков при запросе', default=False,
+        help_text='Включается, когда подписчиков становится слишком много, '
+                  'и больше не выключается'
+    )
+
+    def __str__(self):
+        return str(self.user)
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name="feed_entries"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name="feed_entries"
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        unique_together = ('user', 'post')
+
+
+class SearchTerm(models.Model):
+    """Запись инвертированного индекса: слово и пост, где оно встречается."""
+    term = models.CharField(max_length=100)
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name="search_terms"
+    )
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = 'Слово индекса'
+        verbose_name_plural = 'Слова индекса'
+        unique_together = ('term', 'post')
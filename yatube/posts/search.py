@@ -0,0 +1,265 @@
+import base64
+import binascii
+import json
+import re
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+
+from .images import prefetch_image_variants
+from .models import Comment, Post, SearchTerm
+from .utils import CursorPage
+
+FTS_TABLE = 'posts_search'
+# Совпадение в тексте поста весит больше совпадения в комментариях
+TEXT_WEIGHT = 2
+COMMENTS_WEIGHT = 1
+TOKEN_RE = re.compile(r'\w{2,}')
+
+
+def tokenize(text):
+    return [term[:100] for term in TOKEN_RE.findall(text.lower())]
+
+
+@lru_cache(maxsize=None)
+def _has_fts_table(database_name):
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def search_backend():
+    """fts5 — виртуальная таблица SQLite, inverted — таблица SearchTerm."""
+    backend = settings.POSTS_SEARCH_BACKEND
+    if backend == 'auto':
+        database_name = connection.settings_dict['NAME']
+        return 'fts5' if _has_fts_table(database_name) else 'inverted'
+    return backend
+
+
+def post_document(post_id):
+    """Текст поста и его комментариев для индекса."""
+    text = Post.objects.filter(pk=post_id).values_list(
+        'text', flat=True
+    ).first()
+    comments = Comment.objects.filter(post_id=post_id).values_list(
+        'text', flat=True
+    )
+    return text, '\n'.join(comments)
+
+
+def index_post(post_id):
+    text, comments = post_document(post_id)
+    if text is None:
+        unindex_post(post_id)
+    elif search_backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text, comments) '
+                'VALUES (%s, %s, %s)',
+                [post_id, text, comments]
+            )
+    else:
+        weights = Counter()
+        for term in tokenize(text):
+            weights[term] += TEXT_WEIGHT
+        for term in tokenize(comments):
+            weights[term] += COMMENTS_WEIGHT
+        SearchTerm.objects.filter(post_id=post_id).delete()
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term, post_id=post_id, weight=weight)
+            for term, weight in weights.items()
+        )
+
+
+def index_comment(post_id, text):
+    """
+    Добавляет новый комментарий в индекс поста.
+
+    Остальные комментарии не перечитываются: в fts5 текст дописывается к
+    колонке comments, в inverted веса слов комментария прибавляются
+    атомарным UPDATE, поэтому одновременные комментарии не теряются.
+    """
+    if search_backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {FTS_TABLE} SET comments = CASE '
+                "WHEN comments = '' THEN %s "
+                'ELSE comments || char(10) || %s END WHERE rowid = %s',
+                [text, text, post_id]
+            )
+        return
+    weights = Counter()
+    for term in tokenize(text):
+        weights[term] += COMMENTS_WEIGHT
+    SearchTerm.objects.bulk_create(
+        (
+            SearchTerm(term=term, post_id=post_id, weight=0)
+            for term in weights
+        ),
+        ignore_conflicts=True
+    )
+    terms_by_weight = {}
+    for term, weight in weights.items():
+        terms_by_weight.setdefault(weight, []).append(term)
+    for weight, terms in terms_by_weight.items():
+        SearchTerm.objects.filter(post_id=post_id, term__in=terms).update(
+            weight=F('weight') + weight
+        )
+
+
+def unindex_post(post_id):
+    if search_backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+    else:
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+
+def _fts_match(terms):
+    # Все слова запроса в кавычках: пользовательский ввод не становится
+    # синтаксисом FTS5
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def _fts_ranked_ids(terms, group_id, author_id, after, limit):
+    # bm25 тем меньше, чем точнее совпадение
+    match = _fts_match(terms)
+    sql = [
+        'SELECT r.id, r.score FROM ('
+        f'SELECT rowid AS id, bm25({FTS_TABLE}, %s, %s) AS score '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        ') AS r INNER JOIN posts_post ON posts_post.id = r.id WHERE 1 = 1'
+    ]
+    params = [TEXT_WEIGHT, COMMENTS_WEIGHT, match]
+    if group_id is not None:
+        sql.append('AND posts_post.group_id = %s')
+        params.append(group_id)
+    if author_id is not None:
+        sql.append('AND posts_post.author_id = %s')
+        params.append(author_id)
+    if after is not None:
+        sql.append('AND (r.score > %s OR (r.score = %s AND r.id < %s))')
+        params.extend([after[0], after[0], after[1]])
+    sql.append('ORDER BY r.score, r.id DESC LIMIT %s')
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        return cursor.fetchall()
+
+
+def _inverted_ranked_ids(terms, group_id, author_id, after, limit):
+    matches = SearchTerm.objects.filter(term__in=terms)
+    if group_id is not None:
+        matches = matches.filter(post__group_id=group_id)
+    if author_id is not None:
+        matches = matches.filter(post__author_id=author_id)
+    ranked = matches.values('post_id').annotate(
+        matched=Count('term', distinct=True),
+        score=Sum('weight') * -1
+    ).filter(matched=len(set(terms)))
+    if after is not None:
+        ranked = ranked.filter(
+            Q(score__gt=after[0])
+            | Q(score=after[0], post_id__lt=after[1])
+        )
+    ranked = ranked.order_by('score', '-post_id')
+    return list(ranked.values_list('post_id', 'score')[:limit])
+
+
+def ranked_post_ids(query, group_id=None, author_id=None, after=None,
+                    limit=None):
+    """Пары (id поста, оценка) по убыванию релевантности."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    limit = limit or settings.POSTS_SEARCH_MAX_RESULTS
+    if search_backend() == 'fts5':
+        return _fts_ranked_ids(terms, group_id, author_id, after, limit)
+    return _inverted_ranked_ids(terms, group_id, author_id, after, limit)
+
+
+def filter_matching(queryset, query, field='pk'):
+    """
+    queryset, суженный до постов со всеми словами запроса.
+
+    Совпадения проверяются подзапросом к индексу без ранжирования и без
+    предела POSTS_SEARCH_MAX_RESULTS: админке нужны все найденные записи,
+    а не первая тысяча. field — поле queryset с id поста.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return queryset.none()
+    if search_backend() == 'fts5':
+        # RawSQL в field__in дал бы IN ((SELECT ...)), а SQLite считает
+        # подзапрос в скобках скалярным и берет только первую строку
+        opts = queryset.model._meta
+        column = opts.pk if field == 'pk' else opts.get_field(field)
+        quote = connection.ops.quote_name
+        return queryset.extra(
+            where=[
+                f'{quote(opts.db_table)}.{quote(column.column)} IN ('
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[_fts_match(terms)]
+        )
+    post_ids = SearchTerm.objects.filter(term__in=terms).values(
+        'post_id'
+    ).annotate(
+        matched=Count('term', distinct=True)
+    ).filter(matched=len(set(terms))).values('post_id')
+    return queryset.filter(**{f'{field}__in': post_ids})
+
+
+def encode_cursor(score, post_id):
+    payload = json.dumps([score, post_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        score, post_id = json.loads(base64.urlsafe_b64decode(padded))
+        return float(score), int(post_id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def search_posts(query, group_id=None, author_id=None, cursor=None,
+                 per_page=10):
+    """Страница результатов поиска с курсором на следующую."""
+    after = decode_cursor(cursor) if cursor else None
+    rows = ranked_post_ids(
+        query, group_id, author_id, after, limit=per_page + 1
+    )
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.for_listing().in_bulk([pk for pk, _ in rows])
+    object_list = prefetch_image_variants(
+        posts[pk] for pk, _ in rows if pk in posts
+    )
+    next_cursor = None
+    if has_next:
+        post_id, score = rows[-1]
+        next_cursor = encode_cursor(score, post_id)
+    return CursorPage(object_list, None, next_cursor, None)
+
+
+def rebuild_index():
+    """Полностью перестраивает индекс активного бэкенда."""
+    if search_backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    else:
+        SearchTerm.objects.all().delete()
+    total = 0
+    for post_id in Post.objects.values_list('pk', flat=True).iterator():
+        index_post(post_id)
+        total += 1
+    return total
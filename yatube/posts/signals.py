@@ -0,0 +1,286 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from .counts import (
+    bump_feed_versions, change_counts, feed_count_key, feed_version_key
+)
+from .counters import (
+    change_group_counter, change_post_counter, change_profile_counter
+)
+from .feed import backfill_feed, fan_out_post, following_key, trim_feed
+from .fragments import invalidate_post_cards
+from .models import Comment, Follow, Group, Post, Profile
+from .search import index_comment, index_post, unindex_post
+
+User = get_user_model()
+
+
+def post_feed_keys(post, group_id):
+    keys = [
+        feed_count_key('all'),
+        feed_count_key('author', post.author_id),
+    ]
+    if group_id is not None:
+        keys.append(feed_count_key('group', group_id))
+    return keys
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw, **kwargs):
+    if instance.pk is None or raw:
+        return
+    instance._previous_group_id = Post.objects.filter(
+        pk=instance.pk
+    ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def update_counts_on_post_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        change_counts(post_feed_keys(instance, instance.group_id), 1)
+        bump_feed_versions([
+            feed_version_key('author-posts', instance.author_id)
+        ])
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id != instance.group_id:
+        if previous_group_id is not None:
+            change_counts([feed_count_key('group', previous_group_id)], -1)
+        if instance.group_id is not None:
+            change_counts([feed_count_key('group', instance.group_id)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def update_counts_on_post_delete(sender, instance, **kwargs):
+    change_counts(post_feed_keys(instance, instance.group_id), -1)
+    bump_feed_versions([
+        feed_version_key('author-posts', instance.author_id)
+    ])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_following_authors(sender, instance, **kwargs):
+    cache.delete(following_key(instance.user_id))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_follow_feed(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        backfill_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_follow_feed(sender, instance, **kwargs):
+    trim_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_card_on_post_change(sender, instance, **kwargs):
+    invalidate_post_cards([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_card_on_comment_change(sender, instance, **kwargs):
+    invalidate_post_cards([instance.post_id])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_cards_on_group_change(sender, instance, **kwargs):
+    invalidate_post_cards(
+        instance.posts.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_index_version(sender, **kwargs):
+    bump_feed_versions([feed_version_key('all')])
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_feed_versions(sender, instance, **kwargs):
+    keys = [
+        feed_version_key('author', instance.author_id),
+        feed_version_key('post', instance.pk),
+    ]
+    group_ids = {
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    }
+    keys.extend(
+        feed_version_key('group', group_id)
+        for group_id in group_ids if group_id is not None
+    )
+    bump_feed_versions(keys)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_feed_version(sender, instance, **kwargs):
+    # Названия групп есть на карточках всех лент, поэтому кроме версии
+    # самой группы меняется и общая версия групп
+    bump_feed_versions([
+        feed_version_key('group', instance.pk), feed_version_key('groups')
+    ])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_commented_post_version(sender, instance, **kwargs):
+    # Число комментариев есть на карточке поста во всех лентах, поэтому
+    # меняются и версии главной, автора и группы
+    keys = [
+        feed_version_key('post', instance.post_id),
+        feed_version_key('all'),
+    ]
+    post = Post.objects.filter(pk=instance.post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    if post is not None:
+        author_id, group_id = post
+        keys.append(feed_version_key('author', author_id))
+        if group_id is not None:
+            keys.append(feed_version_key('group', group_id))
+    bump_feed_versions(keys)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_followed_author_version(sender, instance, **kwargs):
+    # Профиль подписчика показывает число его подписок
+    bump_feed_versions([
+        feed_version_key('author', instance.author_id),
+        feed_version_key('author', instance.user_id),
+    ])
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw, **kwargs):
+    if not raw:
+        index_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_saved_comment(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        index_comment(instance.post_id, instance.text)
+    else:
+        index_post(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def reindex_uncommented_post(sender, instance, **kwargs):
+    index_post(instance.post_id)
+
+
+# Поля пользователя, которые выводятся на карточке поста
+CARD_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, raw, update_fields, **kwargs):
+    # Вход сохраняет только last_login, и карточки сбрасывать не нужно
+    if instance.pk is None or raw:
+        return
+    if update_fields is not None and not (
+        set(update_fields) & set(CARD_USER_FIELDS)
+    ):
+        return
+    instance._previous_names = User.objects.filter(
+        pk=instance.pk
+    ).values_list(*CARD_USER_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_cards_on_author_rename(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_names', None)
+    instance._previous_names = None
+    names = tuple(getattr(instance, field) for field in CARD_USER_FIELDS)
+    if previous is None or previous == names:
+        return
+    posts = list(instance.posts.values_list('pk', 'group_id'))
+    invalidate_post_cards([pk for pk, _ in posts])
+    keys = [
+        feed_version_key('all'), feed_version_key('author', instance.pk)
+    ]
+    keys.extend(
+        feed_version_key('group', group_id)
+        for group_id in {group_id for _, group_id in posts}
+        if group_id is not None
+    )
+    bump_feed_versions(keys)
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        change_profile_counter(instance.author_id, 'posts_count', 1)
+        change_group_counter(instance.group_id, 1)
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id != instance.group_id:
+        change_group_counter(previous_group_id, -1)
+        change_group_counter(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_profile_counter(instance.author_id, 'posts_count', -1)
+    change_group_counter(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_post_counter(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_post_counter(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_profile_counter(instance.author_id, 'followers_count', 1)
+        change_profile_counter(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_profile_counter(instance.author_id, 'followers_count', -1)
+    change_profile_counter(instance.user_id, 'following_count', -1)
@@ -0,0 +1,135 @@
+import io
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import rfc3339_date
+from django.utils.http import http_date
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from .counts import feed_modified, feed_version
+
+FEED_FORMATS = {
+    'atom': 'application/atom+xml; charset=utf-8',
+    'json': 'application/feed+json; charset=utf-8',
+}
+
+FeedSource = namedtuple(
+    'FeedSource', ['feed', 'pk', 'title', 'link', 'queryset']
+)
+
+
+def feed_etag(source, fmt):
+    return '"{}-{}-{}-{}"'.format(
+        fmt, source.feed, source.pk or 0,
+        feed_version(source.feed, source.pk)
+    )
+
+
+def _drain(buffer):
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def atom_chunks(request, source, posts, updated):
+    """Atom-документ частями: заголовок ленты, по записи на пост, конец."""
+    buffer = io.StringIO()
+    xml = SimplerXMLGenerator(buffer, 'utf-8')
+    link = request.build_absolute_uri(source.link)
+    xml.startDocument()
+    xml.startElement('feed', {'xmlns': 'http://www.w3.org/2005/Atom'})
+    xml.addQuickElement('title', source.title)
+    xml.addQuickElement('link', '', {'rel': 'alternate', 'href': link})
+    xml.addQuickElement(
+        'link', '', {'rel': 'self', 'href': request.build_absolute_uri()}
+    )
+    xml.addQuickElement('id', link)
+    xml.addQuickElement('updated', rfc3339_date(updated))
+    yield _drain(buffer)
+    for post in posts:
+        post_link = request.build_absolute_uri(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        xml.startElement('entry', {})
+        xml.addQuickElement('title', str(post))
+        xml.addQuickElement(
+            'link', '', {'rel': 'alternate', 'href': post_link}
+        )
+        xml.addQuickElement('id', post_link)
+        xml.addQuickElement('updated', rfc3339_date(post.pub_date))
+        xml.startElement('author', {})
+        xml.addQuickElement('name', post.author.get_username())
+        xml.endElement('author')
+        if post.group is not None:
+            xml.addQuickElement('category', '', {'term': post.group.slug})
+        xml.addQuickElement('content', post.text, {'type': 'text'})
+        xml.endElement('entry')
+        yield _drain(buffer)
+    xml.endElement('feed')
+    yield _drain(buffer)
+
+
+def json_chunks(request, source, posts, updated):
+    """JSON Feed 1.1 частями: шапка, по элементу на пост, конец."""
+    header = json.dumps({
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': source.title,
+        'home_page_url': request.build_absolute_uri(source.link),
+        'feed_url': request.build_absolute_uri(),
+    }, ensure_ascii=False)
+    yield header[:-1] + ', "items": ['
+    for number, post in enumerate(posts):
+        item = {
+            'id': str(post.pk),
+            'url': request.build_absolute_uri(
+                reverse('posts:post_detail', args=[post.pk])
+            ),
+            'content_text': post.text,
+            'date_published': rfc3339_date(post.pub_date),
+            'authors': [{'name': post.author.get_username()}],
+        }
+        if post.group is not None:
+            item['tags'] = [post.group.slug]
+        yield (', ' if number else '') + json.dumps(item, ensure_ascii=False)
+    yield ']}'
+
+
+CHUNKS = {
+    'atom': atom_chunks,
+    'json': json_chunks,
+}
+
+
+def feed_response(request, source, fmt):
+    """
+    Потоковый ответ ленты с ETag и Last-Modified.
+
+    ETag берется из версии ленты, Last-Modified — из времени ее последнего
+    изменения. Если клиент прислал совпадающие заголовки, возвращается 304
+    без чтения постов.
+    """
+    etag = feed_etag(source, fmt)
+    modified = feed_modified(source.feed, source.pk)
+    timestamp = int(modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is None:
+        posts = source.queryset[:settings.POSTS_FEED_ITEMS].iterator()
+        response = StreamingHttpResponse(
+            CHUNKS[fmt](
+                request, source, posts,
+                datetime.fromtimestamp(modified, tz=timezone.utc)
+            ),
+            content_type=FEED_FORMATS[fmt]
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(timestamp)
+    return response
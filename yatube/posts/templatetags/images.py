@@ -0,0 +1,40 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from posts.images import MIME_TYPES, image_variants
+
+register = template.Library()
+
+
+def srcset(candidates):
+    return ', '.join(f'{url} {width}w' for url, width in candidates)
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', css_class=''):
+    """
+    <picture> с адаптивными вариантами картинки.
+
+    WebP отдается браузерам, которые его поддерживают, остальные получают
+    JPEG. Пока варианты не созданы, выводится исходный файл.
+    """
+    if not image:
+        return ''
+    variants = dict(image_variants(image))
+    fallback = variants.pop('JPEG', [])
+    src = fallback[len(fallback) // 2][0] if fallback else image.url
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[image_format], srcset(candidates), sizes)
+            for image_format, candidates in variants.items()
+        )
+    )
+    if fallback:
+        img = format_html(
+            '<img class="{}" src="{}" srcset="{}" sizes="{}">',
+            css_class, src, srcset(fallback), sizes
+        )
+    else:
+        img = format_html('<img class="{}" src="{}">', css_class, src)
+    return format_html('<picture>{}{}</picture>', sources, img)
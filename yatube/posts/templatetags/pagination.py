@@ -0,0 +1,10 @@
+from django import template
+
+from posts.utils import elided_page_range
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page):
+    return elided_page_range(page)
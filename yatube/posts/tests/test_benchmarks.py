@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from posts import benchmarks
+from posts.models import Comment, FeedEntry, Follow, Post, User
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        benchmarks.seed(users=4, groups=2, posts=12, comments=6, follows=4)
+
+    def test_seed_volumes(self):
+        """Наполнение создает заданные объемы и материализует ленты"""
+        self.assertEqual(Post.objects.count(), 12)
+        self.assertEqual(Comment.objects.count(), 6)
+        self.assertEqual(Follow.objects.count(), 4)
+        self.assertTrue(FeedEntry.objects.exists())
+
+    def test_client_run_measures_every_page(self):
+        """Замер через клиент покрывает все страницы из списка"""
+        user = User.objects.filter(follower__isnull=False).first()
+        results = benchmarks.run_client(user, requests=2)
+        self.assertEqual(set(results), {
+            'index', 'group_posts', 'profile', 'post_detail',
+            'follow_index', 'post_create',
+        })
+        for name, result in results.items():
+            with self.subTest(page=name):
+                self.assertEqual(result['requests'], 2)
+                self.assertGreater(result['p50'], 0)
+        slower = {
+            name: dict(result, p50=result['p50'] * 2)
+            for name, result in results.items()
+        }
+        changes = benchmarks.compare({'client': slower}, {'client': results})
+        self.assertAlmostEqual(changes['client:index'], 100.0)
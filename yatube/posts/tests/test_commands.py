@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import wait
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+
+from posts.models import (
+    Comment, FeedEntry, Follow, Group, Post, Profile, User
+)
+from posts.thumbnails import thumbnail_specs
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class ExplainFeedsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='explain_author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='explain', description='Описание'
+        )
+        Post.objects.create(author=cls.user, group=cls.group, text='Пост')
+
+    def test_feed_queries_use_indexes(self):
+        """Ленты читаются по составным индексам, а не сканированием."""
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        output = out.getvalue()
+        for index in ('post_feed_idx', 'post_group_feed_idx',
+                      'post_author_feed_idx', 'comment_post_created_idx'):
+            with self.subTest(index=index):
+                self.assertIn(index, output)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateThumbnailsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='thumb_author'),
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_backfill_builds_missing_thumbnails(self):
+        """Команда создает миниатюры для всех постов с картинками"""
+        geometry, options = thumbnail_specs()[0]
+        self.assertIsNone(
+            default.backend.lookup(self.post.image, geometry, **options)
+        )
+        call_command('generate_thumbnails', workers=0, stdout=StringIO())
+        self.assertIsNotNone(
+            default.backend.lookup(self.post.image, geometry, **options)
+        )
+
+    def test_workers_get_bounded_batches(self):
+        """Пул получает не больше --batch-size миниатюр за раз"""
+        Post.objects.create(
+            author=self.post.author, text='Еще картинка',
+            image=SimpleUploadedFile('other.gif', SMALL_GIF, 'image/gif')
+        )
+        command = 'posts.management.commands.generate_thumbnails'
+        with mock.patch(f'{command}.generate_in_worker') as generate, \
+                mock.patch(f'{command}.wait', wraps=wait) as waited:
+            call_command(
+                'generate_thumbnails', workers=2, batch_size=1,
+                stdout=StringIO()
+            )
+        total = 2 * len(thumbnail_specs())
+        self.assertEqual(generate.call_count, total)
+        self.assertEqual(waited.call_count, total)
+        for call in waited.call_args_list:
+            self.assertEqual(len(call[0][0]), 1)
+
+
+class TransferCommandsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='transfer_author')
+        cls.reader = User.objects.create_user(username='transfer_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='transfer', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group,
+            text='Первая строка\nвторая, с "кавычками"'
+        )
+        Post.objects.create(author=cls.author, text='Без группы')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def snapshot(self):
+        return {
+            model: list(model.objects.order_by('pk').values())
+            for model in (Group, Post, Comment, Follow)
+        }
+
+    def round_trip(self, fmt):
+        before = self.snapshot()
+        call_command('export_data', self.directory, format=fmt,
+                     batch_size=1, stdout=StringIO())
+        Group.objects.all().delete()
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        call_command('import_data', self.directory, format=fmt,
+                     batch_size=2, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=self.post)
+        )
+
+    def test_round_trip_jsonl(self):
+        """Выгрузка и загрузка JSONL сохраняют ключи, даты и связи"""
+        self.round_trip('jsonl')
+
+    def test_round_trip_csv(self):
+        """CSV переносит многострочные тексты и пустые внешние ключи"""
+        self.round_trip('csv')
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск продолжает с пачки из контрольной точки"""
+        call_command('export_data', self.directory, models=['post'],
+                     stdout=StringIO())
+        path = os.path.join(self.directory, 'post.jsonl')
+        with open(path, 'rb') as file:
+            first_line = len(file.readline())
+        with open(os.path.join(self.directory,
+                               '.import-checkpoint.json'), 'w') as file:
+            json.dump({'post': {'offset': first_line, 'rows': 1}}, file)
+        Post.objects.all().delete()
+        call_command('import_data', self.directory, models=['post'],
+                     skip_derived=True, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 1)
+
+
+class ReconcileCountersCommandTest(TestCase):
+    def test_creates_missing_profiles(self):
+        """Пользователи, созданные в обход сигналов, получают профили"""
+        User.objects.bulk_create([User(username='bulk_user')])
+        author = User.objects.get(username='bulk_user')
+        Post.objects.create(author=author, text='Пост')
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(user=author).posts_count, 1)
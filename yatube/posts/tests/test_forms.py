@@ -1,16 +1,23 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from posts.forms import PostForm
+from posts.images import prefetch_image_variants
 from posts.models import Group, Post, User
+from posts.thumbnails import enqueue_post_thumbnails
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from PIL import Image, features
 
 
+import io
 import tempfile
 import shutil
 
 
+@override_settings(POSTS_THUMBNAIL_WORKERS=0, POSTS_WRITE_BEHIND=False)
 class TestCreateForm(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -168,3 +175,109 @@ class TestCreateForm(TestCase):
         self.assertEqual(post_1.text, form_data['text'])
         self.assertEqual(post_1.author.username, 'testuser')
         self.assertEqual(post_1.group.title, 'TestGroup1')
+
+
+def image_upload(name, size, image_format='JPEG', mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, image_format)
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), f'image/{image_format.lower()}'
+    )
+
+
+@override_settings(
+    POSTS_IMAGE_MASTER_SIZE=300, POSTS_THUMBNAIL_WORKERS=0,
+    POSTS_THUMBNAIL_SPECS=[
+        ('100x50', {'crop': 'center', 'format': 'WEBP'}),
+        ('100x50', {'crop': 'center', 'format': 'JPEG'}),
+        ('200x100', {'crop': 'center', 'format': 'JPEG'}),
+    ]
+)
+class ImageUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        cls.user = User.objects.create_user(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create_post(self, image):
+        return self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с картинкой', 'image': image}
+        )
+
+    def test_master_downscaled_and_reencoded(self):
+        """Хранится уменьшенная копия, а не загруженный оригинал"""
+        self.create_post(image_upload('photo.png', (1200, 600), 'PNG'))
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+            self.assertEqual(stored.size, (300, 150))
+
+    def test_transparency_kept_as_png(self):
+        self.create_post(
+            image_upload('logo.png', (400, 400), 'PNG', mode='RGBA')
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'PNG')
+            self.assertEqual(stored.size, (300, 300))
+
+    @override_settings(POSTS_IMAGE_MAX_PIXELS=10_000)
+    def test_too_many_pixels_rejected(self):
+        """Слишком большая по пикселям картинка отклоняется формой"""
+        response = self.create_post(image_upload('big.jpg', (200, 100)))
+        self.assertFalse(Post.objects.filter(author=self.user).exists())
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка 200×100 слишком большая.'
+        )
+
+    def test_responsive_image_srcset(self):
+        """Тег выводит srcset по готовым вариантам, а до них — оригинал"""
+        self.create_post(image_upload('photo.jpg', (600, 300)))
+        post = Post.objects.get(text='Пост с картинкой')
+        template = Template(
+            '{% load images %}{% responsive_image post.image %}'
+        )
+        html = template.render(Context({'post': post}))
+        self.assertIn(f'src="{post.image.url}"', html)
+        self.assertNotIn('srcset', html)
+        enqueue_post_thumbnails(post)
+        html = template.render(Context({'post': post}))
+        self.assertRegex(html, r'srcset="[^"]+\.jpg 100w, [^"]+\.jpg 200w"')
+        if features.check('webp'):
+            self.assertIn('type="image/webp"', html)
+        else:
+            self.assertNotIn('webp', html)
+
+    def test_page_variants_resolved_in_one_lookup(self):
+        """Варианты картинок страницы читаются из kvstore одним пакетом"""
+        for number in range(3):
+            self.create_post(image_upload(f'photo{number}.jpg', (600, 300)))
+        posts = list(Post.objects.filter(author=self.user))
+        for post in posts:
+            enqueue_post_thumbnails(post)
+        cache.clear()
+        with self.assertNumQueries(1):
+            posts = prefetch_image_variants(posts)
+        with self.assertNumQueries(0):
+            prefetch_image_variants(posts)
+        for post in posts:
+            with self.subTest(post=post.image.name):
+                widths = [width for _, width in post.image_variants['JPEG']]
+                self.assertEqual(widths, [100, 200])
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '.jpg 200w', count=3)
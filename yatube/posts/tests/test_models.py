@@ -1,6 +1,8 @@
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-from posts.models import Group, Post, User
+from posts.counters import reconcile_counters
+from posts.models import Comment, Follow, Group, Post, Profile, User
 
 
 class PostModelTest(TestCase):
@@ -40,3 +42,86 @@ class PostModelTest(TestCase):
         self.assertEqual(help_text, 'Введите текст поста')
         help_text = post._meta.get_field('group').help_text
         self.assertEqual(help_text, 'Группа, к которой будет относиться пост')
+
+    def test_posts_ordered_newest_first(self):
+        """Посты отдаются от новых к старым, комментарии — по времени."""
+        newer = Post.objects.create(author=self.user, text='Новый пост')
+        self.assertEqual(Post.objects.first(), newer)
+        first = Comment.objects.create(post=newer, author=self.user, text='1')
+        second = Comment.objects.create(post=newer, author=self.user, text='2')
+        self.assertEqual(list(newer.comments.all()), [first, second])
+
+    def test_follow_is_unique(self):
+        """Повторная подписка нарушает ограничение уникальности."""
+        author = User.objects.create_user(username='unique_author')
+        Follow.objects.create(user=self.user, author=author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.user, author=author)
+
+
+class CounterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='counted_author')
+        cls.reader = User.objects.create_user(username='counted_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='counted', description='Описание'
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая', slug='counted-other', description='Описание'
+        )
+
+    def profile(self, user):
+        return Profile.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Посты меняют счетчики автора и групп, включая смену группы"""
+        post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост'
+        )
+        self.assertEqual(self.profile(self.author).posts_count, 1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 0)
+        self.assertEqual(
+            Group.objects.get(pk=self.other_group.pk).posts_count, 1
+        )
+        post.delete()
+        self.assertEqual(self.profile(self.author).posts_count, 0)
+        self.assertEqual(
+            Group.objects.get(pk=self.other_group.pk).posts_count, 0
+        )
+
+    def test_comment_and_follow_counters(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 1)
+        comment.delete()
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 0)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.profile(self.author).followers_count, 1)
+        self.assertEqual(self.profile(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.profile(self.author).followers_count, 0)
+        self.assertEqual(self.profile(self.reader).following_count, 0)
+
+    def test_counters_never_go_negative(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        Profile.objects.filter(user=self.author).update(posts_count=0)
+        post.delete()
+        self.assertEqual(self.profile(self.author).posts_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Сверка исправляет только разошедшиеся счетчики"""
+        Post.objects.create(author=self.author, group=self.group, text='1')
+        Profile.objects.filter(user=self.author).update(posts_count=7)
+        Group.objects.filter(pk=self.group.pk).update(posts_count=0)
+        fixed = reconcile_counters()
+        self.assertEqual(fixed['profile.posts_count'], 1)
+        self.assertEqual(fixed['group.posts_count'], 1)
+        self.assertEqual(fixed['post.comments_count'], 0)
+        self.assertEqual(self.profile(self.author).posts_count, 1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 1)
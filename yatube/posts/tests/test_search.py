@@ -0,0 +1,146 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, SearchTerm, User
+from posts.search import (
+    ranked_post_ids, rebuild_index, search_backend, search_posts
+)
+
+
+class SearchMixin:
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.author = User.objects.create_user(username='writer')
+        cls.other = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Сад', slug='garden', description='Про сад'
+        )
+        cls.title_post = Post.objects.create(
+            text='Яблоки и груши. Яблоки созрели', author=cls.author,
+            group=cls.group
+        )
+        cls.comment_post = Post.objects.create(
+            text='Осенний урожай', author=cls.other
+        )
+        Comment.objects.create(
+            post=cls.comment_post, author=cls.author, text='Какие яблоки!'
+        )
+        cls.other_post = Post.objects.create(
+            text='Про сливы', author=cls.author
+        )
+
+    def setUp(self):
+        rebuild_index()
+
+    def test_backend(self):
+        self.assertEqual(search_backend(), self.backend)
+
+    def test_text_ranks_above_comments(self):
+        page = search_posts('яблоки')
+        self.assertEqual(list(page), [self.title_post, self.comment_post])
+
+    def test_all_terms_required(self):
+        page = search_posts('яблоки груши')
+        self.assertEqual(list(page), [self.title_post])
+
+    def test_filters(self):
+        self.assertEqual(
+            list(search_posts('яблоки', group_id=self.group.pk)),
+            [self.title_post]
+        )
+        self.assertEqual(
+            list(search_posts('яблоки', author_id=self.other.pk)),
+            [self.comment_post]
+        )
+
+    def test_cursor(self):
+        first = search_posts('яблоки', per_page=1)
+        self.assertEqual(list(first), [self.title_post])
+        second = search_posts('яблоки', cursor=first.next_cursor, per_page=1)
+        self.assertEqual(list(second), [self.comment_post])
+        self.assertFalse(second.has_next())
+
+    def test_index_follows_changes(self):
+        Comment.objects.create(
+            post=self.other_post, author=self.other, text='Тоже яблоки'
+        )
+        self.assertIn(self.other_post, list(search_posts('яблоки')))
+        Post.objects.get(pk=self.title_post.pk).delete()
+        self.assertNotIn(self.title_post, list(search_posts('яблоки')))
+
+    def test_new_comment_indexed_incrementally(self):
+        """Новый комментарий индексируется без чтения остальных"""
+        with mock.patch('posts.search.post_document') as post_document:
+            for text in ('Первый: груши', 'Второй: груши и яблоки'):
+                Comment.objects.create(
+                    post=self.other_post, author=self.other, text=text
+                )
+        post_document.assert_not_called()
+        self.assertIn(self.other_post, list(search_posts('груши яблоки')))
+        incremental = ranked_post_ids('груши яблоки')
+        rebuild_index()
+        self.assertEqual(ranked_post_ids('груши яблоки'), incremental)
+
+    def test_search_page(self):
+        response = self.client.get(
+            reverse('posts:search'),
+            {'q': 'яблоки', 'author': self.author.username}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), [self.title_post]
+        )
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'яблоки', 'group': 'unknown'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_search(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'груши'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.title_post]
+        )
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'яблоки'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    @override_settings(POSTS_SEARCH_MAX_RESULTS=1)
+    def test_admin_search_is_not_limited(self):
+        """Админка находит все посты, а не первые POSTS_SEARCH_MAX_RESULTS"""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'яблоки'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'яблоки'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+@override_settings(POSTS_SEARCH_BACKEND='fts5')
+class FTSSearchTest(SearchMixin, TestCase):
+    backend = 'fts5'
+
+
+@override_settings(POSTS_SEARCH_BACKEND='inverted')
+class InvertedSearchTest(SearchMixin, TestCase):
+    backend = 'inverted'
+
+    def test_terms_weighted(self):
+        self.assertEqual(
+            SearchTerm.objects.get(term='яблоки', post=self.title_post).weight,
+            4
+        )
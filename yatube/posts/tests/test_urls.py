@@ -1,4 +1,4 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from http import HTTPStatus
 from django.urls import reverse
 from django.core.cache import cache
@@ -6,6 +6,7 @@ from django.core.cache import cache
 from posts.models import Group, Post, User
 
 
+@override_settings(POSTS_WRITE_BEHIND=False)
 class URLTests(TestCase):
     @classmethod
     def setUpClass(self):
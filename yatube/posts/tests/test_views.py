@@ -1,21 +1,48 @@
 from django import forms
-from django.test import TestCase, Client
+from django.test import (
+    TestCase, TransactionTestCase, Client, override_settings
+)
+from django.db import (
+    DatabaseError, OperationalError, connection, transaction
+)
+from django.db.models.signals import pre_save
 from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from django.core.paginator import Page
+from django.core.paginator import Page, Paginator
+from django.template.loader import render_to_string
+from xml.etree import ElementTree
+import json
 
-from posts.models import Group, Post, Comment, Follow, User
+from posts.counts import (
+    bump_feed_versions, feed_count_key, feed_version, feed_version_key
+)
+from posts.feed import follow_count_key
+from posts.fragments import post_card_keys
+from posts.models import Group, Post, Comment, FeedEntry, Follow, User
+from posts.tests.utils import OnCommitMixin
+from posts.thumbnails import (
+    PrebuiltThumbnailBackend, enqueue_post_thumbnails, enqueue_thumbnail,
+    thumbnail_specs
+)
+from posts.utils import CursorPage, elided_page_range
 
 import tempfile
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
 POSTS_ON_FIRST_PAGE = 10
 POSTS_ON_SECOND_PAGE = 3
 
 
-class ViewTests(TestCase):
+# Миниатюры создаются в потоке теста, чтобы фоновый пул не писал в
+# удаленный MEDIA_ROOT и не менял версии лент посреди проверок
+@override_settings(POSTS_THUMBNAIL_WORKERS=0, POSTS_WRITE_BEHIND=False)
+class ViewTests(OnCommitMixin, TestCase):
     @classmethod
     def setUpClass(self):
         super().setUpClass()
@@ -97,7 +124,8 @@ class ViewTests(TestCase):
         self.assertIn('page_obj', response.context)
         self.assertIsInstance(response.context['page_obj'], Page)
         self.assertTrue(len(response.context['page_obj']) > 0)
-        first_object = response.context['page_obj'][0]
+        self.assertEqual(response.context['page_obj'][0], self.post2)
+        first_object = response.context['page_obj'][1]
         self.assertEqual(first_object.text, self.post.text)
         self.assertEqual(
             first_object.author.username, self.post.author.username
@@ -124,7 +152,8 @@ class ViewTests(TestCase):
         self.assertIn('page_obj', response.context)
         self.assertIsInstance(response.context['page_obj'], Page)
         self.assertTrue(len(response.context['page_obj']) > 0)
-        first_object = response.context['page_obj'][0]
+        self.assertEqual(response.context['page_obj'][0], self.post2)
+        first_object = response.context['page_obj'][1]
         self.assertEqual(first_object.image, 'posts/small.gif')
         self.assertEqual(
             response.context['author'].username, self.post.author.username
@@ -200,16 +229,109 @@ class ViewTests(TestCase):
         self.assertEqual(Comment.objects.last(), comment)
 
     def test_cache_in_index_page(self):
-        """Проверяем работу кэша на главной странице"""
+        """Карточки постов кэшируются и сбрасываются при изменении"""
         first_state = self.authorized_client.get(reverse('posts:index'))
-        testing_post = Post.objects.first()
+        card_keys = post_card_keys([self.post.pk])
+        self.assertTrue(cache.get_many(card_keys))
+        testing_post = Post.objects.get(pk=self.post.pk)
         testing_post.text = 'Измененный текст'
         testing_post.save()
+        self.assertFalse(cache.get_many(card_keys))
         second_state = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(first_state.content, second_state.content)
-        cache.clear()
-        third_state = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(first_state.content, third_state.content)
+        self.assertNotEqual(first_state.content, second_state.content)
+        self.assertContains(second_state, 'Измененный текст')
+
+    def test_index_page_served_from_cache(self):
+        """Повторный запрос главной не обращается к базе"""
+        enqueue_post_thumbnails(self.post)
+        self.guest_client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            self.guest_client.get(reverse('posts:index'))
+
+    @override_settings(POSTS_THUMBNAIL_WORKERS=1)
+    def test_thumbnails_are_not_built_in_request(self):
+        """Запрос отдает оригинал и только ставит миниатюры в пул"""
+        patch_generate = mock.patch.object(
+            PrebuiltThumbnailBackend, 'generate'
+        )
+        with mock.patch('posts.thumbnails.get_executor') as get_executor:
+            with patch_generate as generate:
+                response = self.guest_client.get(reverse('posts:index'))
+                generate.assert_not_called()
+        self.assertContains(response, self.post.image.url)
+        self.assertNotContains(response, settings.MEDIA_URL + 'cache/')
+        submit = get_executor.return_value.submit
+        self.assertEqual(submit.call_count, len(thumbnail_specs()))
+        for call in submit.call_args_list:
+            worker, *args = call[0]
+            worker(*args)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, self.post.image.url)
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_ready_thumbnails_refresh_cached_cards(self):
+        """Карточка без srcset сбрасывается, когда готовы все миниатюры"""
+        with mock.patch('posts.thumbnails.enqueue_thumbnail'):
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'srcset')
+        enqueue_post_thumbnails(self.post)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'srcset')
+        self.assertNotContains(response, f'src="{self.post.image.url}"')
+
+    @override_settings(POSTS_THUMBNAIL_WORKERS=1)
+    def test_thumbnail_enqueued_once_while_in_flight(self):
+        """Миниатюра, которая уже создается, повторно в пул не ставится"""
+        geometry, options = thumbnail_specs()[0]
+        with mock.patch('posts.thumbnails.get_executor') as get_executor:
+            submit = get_executor.return_value.submit
+            for _ in range(3):
+                enqueue_thumbnail(self.post.image.name, geometry, options)
+            self.assertEqual(submit.call_count, 1)
+            worker, *args = submit.call_args[0]
+            worker(*args)
+            enqueue_thumbnail(self.post.image.name, geometry, options)
+            self.assertEqual(submit.call_count, 2)
+
+    def test_post_card_cache_keeps_user_fragments(self):
+        """Ссылка на редактирование не попадает в общий кэш карточки"""
+        edit_url = reverse('posts:post_edit', args=[self.post.pk])
+        response = self.authorized_client_author.get(reverse('posts:index'))
+        self.assertContains(response, edit_url)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response, edit_url)
+
+    def test_group_change_invalidates_post_cards(self):
+        """Переименование группы сбрасывает карточки ее постов"""
+        self.guest_client.get(reverse('posts:index'))
+        group = Group.objects.get(pk=self.post.group_id)
+        group.title = 'Новое название'
+        group.save()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новое название')
+
+    def test_author_rename_invalidates_post_cards(self):
+        """Новое имя автора видно в закэшированных лентах"""
+        group_url = reverse('posts:group_list', args=['groupslug1'])
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(group_url)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Лев'
+        author.last_name = 'Толстой'
+        author.save()
+        for url in (reverse('posts:index'), group_url):
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Автор: Лев Толстой')
+
+    def test_login_keeps_post_cards(self):
+        """Вход автора не сбрасывает карточки его постов"""
+        self.guest_client.get(reverse('posts:index'))
+        card_keys = post_card_keys([self.post.pk])
+        cached = cache.get_many(card_keys)
+        self.assertTrue(cached)
+        self.client.force_login(User.objects.get(pk=self.author.pk))
+        self.assertEqual(cache.get_many(card_keys), cached)
 
 
 class PaginatorViewsTest(TestCase):
@@ -271,6 +393,392 @@ class PaginatorViewsTest(TestCase):
                 POSTS_ON_SECOND_PAGE)
 
 
+@override_settings(POSTS_WRITE_BEHIND=False)
+class FollowConcurrencyTest(TransactionTestCase):
+    THREADS = 8
+    REQUESTS = 5
+    # Сколько секунд запрос повторяется, пока таблица заблокирована
+    LOCK_DEADLINE = 10
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='popular')
+        self.follower = User.objects.create_user(username='clicker')
+        # Пауза перед INSERT расширяет окно между проверкой и записью,
+        # чтобы гонка проявлялась на каждом прогоне
+        pre_save.connect(self.slow_insert, sender=Follow)
+        self.addCleanup(
+            pre_save.disconnect, self.slow_insert, sender=Follow
+        )
+
+    @staticmethod
+    def slow_insert(sender, **kwargs):
+        time.sleep(0.01)
+
+    def retry_locked(self, function):
+        # Тестовая база SQLite в памяти не ждет блокировку, а сразу
+        # отвечает «table is locked»; файловая база ждет busy_timeout.
+        # Повтор безопасен, потому что подписка идемпотентна
+        deadline = time.monotonic() + self.LOCK_DEADLINE
+        while True:
+            try:
+                return function()
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.001)
+
+    def hammer(self, client, barrier):
+        url = reverse('posts:profile_follow', args=[self.author.username])
+        try:
+            barrier.wait()
+            return [
+                self.retry_locked(lambda: client.get(url)).status_code
+                for _ in range(self.REQUESTS)
+            ]
+        finally:
+            connection.close()
+
+    def test_concurrent_follow_creates_single_row(self):
+        """Одновременные клики «Подписаться» дают одну подписку"""
+        clients = [Client() for _ in range(self.THREADS)]
+        for client in clients:
+            client.force_login(self.follower)
+        barrier = threading.Barrier(self.THREADS, timeout=10)
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            results = list(executor.map(
+                lambda client: self.hammer(client, barrier), clients
+            ))
+        statuses = {status for result in results for status in result}
+        self.assertEqual(statuses, {302})
+        self.assertEqual(Follow.objects.filter(
+            user=self.follower, author=self.author
+        ).count(), 1)
+        self.author.profile.refresh_from_db()
+        self.assertEqual(self.author.profile.followers_count, 1)
+
+
+class ElidedPageRangeTest(TestCase):
+    def setUp(self):
+        self.paginator = Paginator(range(100000), 1)
+
+    def test_window_around_current_page(self):
+        """Края, соседи текущей страницы и пропуски между ними"""
+        cases = {
+            1: [1, 2, 3, None, 100000],
+            4: [1, 2, 3, 4, 5, 6, None, 100000],
+            500: [1, None, 498, 499, 500, 501, 502, None, 100000],
+            100000: [1, None, 99998, 99999, 100000],
+        }
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                page = self.paginator.page(number)
+                self.assertEqual(
+                    elided_page_range(page, on_each_side=2, on_ends=1),
+                    expected
+                )
+
+    def test_short_range_not_elided(self):
+        page = Paginator(range(5), 1).page(3)
+        self.assertEqual(elided_page_range(page), [1, 2, 3, 4, 5])
+
+    def test_paginator_html_size_does_not_grow(self):
+        """Размер навигации не зависит от общего числа страниц"""
+        items = []
+        for total in (1000, 100000):
+            page = Paginator(range(total), 1).page(total // 2)
+            html = render_to_string(
+                'posts/includes/paginator.html', {'page_obj': page}
+            )
+            self.assertIn('&hellip;', html)
+            items.append(html.count('<li'))
+        self.assertEqual(items[0], items[1])
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='cursor_author')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.author)
+            for i in range(POSTS_ON_FIRST_PAGE + POSTS_ON_SECOND_PAGE)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_walks_all_posts_forward_and_back(self):
+        """Курсоры next/previous обходят ленту без пропусков и повторов"""
+        url = reverse('posts:profile', args=[self.author.username])
+        first = self.client.get(url + '?cursor=').context['page_obj']
+        self.assertIsInstance(first, CursorPage)
+        self.assertEqual(len(first), POSTS_ON_FIRST_PAGE)
+        self.assertFalse(first.has_previous())
+        second = self.client.get(
+            url + f'?cursor={first.next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(len(second), POSTS_ON_SECOND_PAGE)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            [post.pk for post in first] + [post.pk for post in second],
+            list(Post.objects.order_by(
+                '-pub_date', '-pk'
+            ).values_list('pk', flat=True))
+        )
+        back = self.client.get(
+            url + f'?cursor={second.previous_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_first_page_link_keeps_cursor_mode(self):
+        """Ссылка на первую страницу не переключает на номера страниц"""
+        url = reverse('posts:profile', args=[self.author.username])
+        first = self.client.get(url + '?cursor=').context['page_obj']
+        response = self.client.get(url + f'?cursor={first.next_cursor}')
+        self.assertContains(response, 'href="?cursor=">Первая')
+        self.assertNotContains(response, 'href="?">')
+
+    def test_invalid_cursor_returns_first_page(self):
+        """Поврежденный курсор отдает первую страницу"""
+        response = self.client.get(
+            reverse('posts:index') + '?cursor=garbage'
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), POSTS_ON_FIRST_PAGE)
+        self.assertContains(response, f'?cursor={page_obj.next_cursor}')
+
+
+class FeedCountTests(TransactionTestCase):
+    """Счетчики меняются после коммита, поэтому транзакции настоящие."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='count_author')
+        self.group = Group.objects.create(
+            title='Группа', slug='count_group', description='Описание'
+        )
+        self.other_group = Group.objects.create(
+            title='Другая', slug='other_group', description='Описание'
+        )
+        self.post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group
+        )
+
+    def test_count_is_cached_and_updated_by_signals(self):
+        """Счетчик ленты берется из кэша и меняется при создании/удалении"""
+        key = feed_count_key('group', self.group.pk)
+        url = reverse('posts:group_list', args=[self.group.slug])
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        self.assertEqual(cache.get(key), 1)
+        post = Post.objects.create(
+            text='Еще пост', author=self.author, group=self.group
+        )
+        self.assertEqual(cache.get(key), 2)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(cache.get(key), 1)
+        self.post.delete()
+        self.assertEqual(cache.get(key), 0)
+
+    def test_rolled_back_post_keeps_count(self):
+        """Откаченная публикация не меняет счетчик ленты"""
+        key = feed_count_key('group', self.group.pk)
+        self.client.get(reverse('posts:group_list', args=[self.group.slug]))
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            Post.objects.create(
+                text='Откаченный пост', author=self.author, group=self.group
+            )
+            raise DatabaseError
+        self.assertEqual(cache.get(key), 1)
+
+    def test_rolled_back_post_keeps_versions(self):
+        """Версии лент меняются только закоммиченной публикацией"""
+        versions = [feed_version('all'), feed_version('group', self.group.pk)]
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            Post.objects.create(
+                text='Откаченный пост', author=self.author, group=self.group
+            )
+            raise DatabaseError
+        self.assertEqual(
+            [feed_version('all'), feed_version('group', self.group.pk)],
+            versions
+        )
+        Post.objects.create(text='Пост', author=self.author, group=self.group)
+        self.assertNotEqual(feed_version('all'), versions[0])
+
+    def test_versions_unique_without_atomic_incr(self):
+        """Без атомарного incr каждое изменение дает новую версию"""
+        seen = {feed_version('all')}
+        with mock.patch('posts.counts.has_atomic_incr', return_value=False):
+            for _ in range(20):
+                bump_feed_versions([feed_version_key('all')])
+                seen.add(feed_version('all'))
+        self.assertEqual(len(seen), 21)
+
+    def test_count_dropped_without_atomic_incr(self):
+        """Без атомарного incr счетчик удаляется и пересчитывается"""
+        key = feed_count_key('group', self.group.pk)
+        self.client.get(reverse('posts:group_list', args=[self.group.slug]))
+        with mock.patch('posts.counts.has_atomic_incr', return_value=False):
+            Post.objects.create(
+                text='Еще пост', author=self.author, group=self.group
+            )
+        self.assertIsNone(cache.get(key))
+
+    def test_follow_feed_count_key_follows_authors(self):
+        """Ключ счетчика ленты подписок меняется подпиской и постами"""
+        follower = User.objects.create_user(username='count_follower')
+        stranger = User.objects.create_user(username='count_stranger')
+        key = follow_count_key(follower.pk)
+        Follow.objects.create(user=follower, author=self.author)
+        self.assertNotEqual(follow_count_key(follower.pk), key)
+        key = follow_count_key(follower.pk)
+        Post.objects.create(text='Чужой пост', author=stranger)
+        self.assertEqual(follow_count_key(follower.pk), key)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertNotEqual(follow_count_key(follower.pk), key)
+        key = follow_count_key(follower.pk)
+        post.delete()
+        self.assertNotEqual(follow_count_key(follower.pk), key)
+
+    def test_post_does_not_touch_follower_keys(self):
+        """Публикация не перебирает подписчиков автора"""
+        for i in range(3):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'reader_{i}'),
+                author=self.author
+            )
+        with mock.patch.object(cache, 'delete_many') as delete_many:
+            Post.objects.create(text='Пост', author=self.author)
+        for call in delete_many.call_args_list:
+            self.assertFalse(
+                [key for key in call[0][0] if ':count:follow:' in key]
+            )
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов страниц не зависит от числа постов и комментариев."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Группа', slug='budget', description='Описание'
+        )
+        cls.authors = [
+            User.objects.create_user(username=f'budget_{i}')
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            for i in range(4):
+                post = Post.objects.create(
+                    author=author, group=cls.group, text=f'Пост {i}'
+                )
+        for author in cls.authors:
+            Comment.objects.create(post=post, author=author, text='Ответ')
+            Follow.objects.create(user=cls.authors[0], author=author)
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.authors[0])
+
+    def test_guest_pages_query_budget(self):
+        """Страницы для гостя укладываются в фиксированное число запросов"""
+        # Кроме индекса, при пустом кэше добавляется поиск ключа для ETag
+        budgets = {
+            reverse('posts:index'): 2,
+            reverse('posts:group_list', args=[self.group.slug]): 4,
+            reverse('posts:profile', args=[self.authors[0].username]): 4,
+            reverse('posts:post_detail', args=[self.post.pk]): 3,
+        }
+        for url, queries in budgets.items():
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.client.get(url)
+
+    def test_follow_index_query_budget(self):
+        """Лента подписок укладывается в фиксированное число запросов"""
+        self.authorized_client.get(reverse('posts:follow_index'))
+        cache.clear()
+        # сессия и пользователь, авторы подписок, счетчик ленты, страница
+        with self.assertNumQueries(5):
+            self.authorized_client.get(reverse('posts:follow_index'))
+
+
+@override_settings(POSTS_COMMENTS_PER_PAGE=5, POSTS_WRITE_BEHIND=False)
+class CommentPaginationTests(OnCommitMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        for i in range(7):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def test_post_detail_shows_first_window(self):
+        """На странице поста только первая порция и ссылка на следующую"""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f'Комментарий {i}' for i in range(5)]
+        )
+        self.assertContains(
+            response,
+            reverse('posts:post_comments', args=[self.post.pk])
+            + f'?cursor={comments.next_cursor}'
+        )
+
+    def test_load_more_returns_next_slice(self):
+        """Фрагмент «Показать еще» содержит только следующую порцию"""
+        first = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        ).context['comments']
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk]),
+            {'cursor': first.next_cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Комментарий 5', 'Комментарий 6']
+        )
+        self.assertNotContains(response, 'Показать еще')
+
+    def test_first_window_cached_until_comment_added(self):
+        """Первая порция берется из кэша и сбрасывается новым комментарием"""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.client.get(url)
+        Comment.objects.filter(post=self.post).update(text='Изменен')
+        self.assertContains(self.client.get(url), 'Комментарий 0')
+        self.authorized_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Новый'}
+        )
+        self.assertContains(self.client.get(url), 'Изменен')
+
+    def test_unknown_post_comments_not_found(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk + 100])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(POSTS_WRITE_BEHIND=False)
 class FollowTests(TestCase):
     def setUp(self):
         self.client_auth_follower = Client()
@@ -302,6 +810,30 @@ class FollowTests(TestCase):
         ))
         self.assertEqual(Follow.objects.all().count(), 0)
 
+    def test_follow_unknown_author_not_found(self):
+        """Подписка на несуществующего автора — 404, а не ошибка сервера"""
+        for name in ('posts:profile_follow', 'posts:profile_unfollow'):
+            with self.subTest(name=name):
+                response = self.client_auth_follower.get(
+                    reverse(name, kwargs={'username': 'nobody'})
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_follow_is_idempotent(self):
+        url = reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.user_following.username}
+        )
+        for _ in range(3):
+            self.client_auth_follower.get(url)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(
+            User.objects.get(
+                pk=self.user_following.pk
+            ).profile.followers_count,
+            1
+        )
+
     def test_subscription_feed(self):
         """запись появляется в ленте подписчиков"""
         Follow.objects.create(user=self.user_follower,
@@ -312,3 +844,217 @@ class FollowTests(TestCase):
         response = self.client_auth_following.get('/follow/')
         self.assertNotContains(response,
                                'Тестовая запись для тестирования ленты')
+
+    def test_feed_materialized_on_write(self):
+        """Подписка, публикация и отписка поддерживают ленту в таблице"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_follower, post=self.post
+        ).exists())
+        new_post = Post.objects.create(
+            author=self.user_following, text='Новая запись'
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_follower, post=new_post
+        ).exists())
+        Follow.objects.filter(user=self.user_follower).delete()
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.user_follower).exists()
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_feed_pulls_posts_of_popular_authors(self):
+        """Посты популярных авторов попадают в ленту без рассылки"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_pull_mode_survives_unfollows(self):
+        """Посты из режима чтения при запросе не пропадают после отписок"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user_following)
+        new_post = Post.objects.create(
+            author=self.user_following, text='Пост популярного автора'
+        )
+        self.assertFalse(FeedEntry.objects.filter(post=new_post).exists())
+        Follow.objects.filter(user=reader).delete()
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertIn(new_post, response.context['page_obj'])
+
+
+class SyndicationFeedTests(OnCommitMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='feed_author')
+        cls.group = Group.objects.create(
+            title='Лента', slug='feed-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост в ленте'
+        )
+        Post.objects.create(author=cls.author, text='Пост без группы')
+
+    def setUp(self):
+        cache.clear()
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_atom_feeds(self):
+        """Atom-ленты главной, группы и профиля отдаются потоком"""
+        urls = {
+            reverse('posts:index_feed', args=['atom']): 2,
+            reverse('posts:group_feed', args=[self.group.slug, 'atom']): 1,
+            reverse('posts:profile_feed',
+                    args=[self.author.username, 'atom']): 2,
+        }
+        for url, entries in urls.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(response.streaming)
+                root = ElementTree.fromstring(self.content(response))
+                self.assertEqual(
+                    len(root.findall('{http://www.w3.org/2005/Atom}entry')),
+                    entries
+                )
+
+    def test_json_feed(self):
+        response = self.client.get(
+            reverse('posts:group_feed', args=[self.group.slug, 'json'])
+        )
+        feed = json.loads(self.content(response))
+        self.assertEqual(feed['title'], self.group.title)
+        self.assertEqual(
+            [item['id'] for item in feed['items']], [str(self.post.pk)]
+        )
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('posts:index_feed', args=['rss']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        """Неизменившаяся лента отдает 304 без запросов к постам"""
+        url = reverse('posts:index_feed', args=['atom'])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified_follows_deletes(self):
+        """Удаление поста сдвигает Last-Modified, хотя новых постов нет"""
+        url = reverse('posts:group_feed', args=[self.group.slug, 'atom'])
+        modified = self.client.get(url)['Last-Modified']
+        with mock.patch('posts.counts.time.time',
+                        return_value=time.time() + 60):
+            Post.objects.filter(pk=self.post.pk).delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], modified)
+
+    def test_group_feed_version_follows_posts(self):
+        url = reverse('posts:group_feed', args=[self.group.slug, 'json'])
+        etag = self.client.get(url)['ETag']
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = None
+        post.save()
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+
+class ConditionalGetTests(OnCommitMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='etag_author')
+        cls.reader = User.objects.create_user(username='etag_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='etag-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ]
+
+    def etags(self, client=None):
+        client = client or self.client
+        return [client.get(url)['ETag'] for url in self.urls]
+
+    def test_unchanged_pages_return_304(self):
+        """Совпавший ETag отдает 304 без выборки постов и рендеринга"""
+        for url, etag in zip(self.urls, self.etags()):
+            with self.subTest(url=url):
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_comment_changes_all_post_pages(self):
+        """Число комментариев на карточке меняет ETag всех лент поста"""
+        before = self.etags()
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        after = self.etags()
+        for url, old, new in zip(self.urls, before, after):
+            with self.subTest(url=url):
+                self.assertNotEqual(old, new)
+        self.assertContains(
+            self.client.get(self.urls[0]), 'комментариев: 1'
+        )
+
+    def test_new_post_changes_feeds(self):
+        before = self.etags()
+        Post.objects.create(author=self.author, group=self.group, text='Еще')
+        after = self.etags()
+        for old, new in zip(before, after):
+            self.assertNotEqual(old, new)
+
+    def test_etag_depends_on_user_and_page(self):
+        client = Client()
+        client.force_login(self.reader)
+        self.assertNotEqual(self.etags(), self.etags(client))
+        first = self.client.get(self.urls[0])['ETag']
+        second = self.client.get(self.urls[0] + '?page=2')['ETag']
+        self.assertNotEqual(first, second)
+
+    def test_follow_changes_profile_etag(self):
+        client = Client()
+        client.force_login(self.reader)
+        before = self.etags(client)
+        follower_url = reverse('posts:profile', args=[self.reader.username])
+        follower_etag = self.client.get(follower_url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertNotEqual(before[2], self.etags(client)[2])
+        response = self.client.get(
+            follower_url, HTTP_IF_NONE_MATCH=follower_etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'подписок: 1')
+
+    def test_missing_objects_still_404(self):
+        for url in (reverse('posts:group_list', args=['missing']),
+                    reverse('posts:profile', args=['missing']),
+                    reverse('posts:post_detail', args=[0])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
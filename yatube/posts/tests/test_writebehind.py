@@ -0,0 +1,153 @@
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from posts import writebehind
+from posts.models import Comment, Follow, Post, User
+
+
+class SlowReadCache:
+    """Кэш, чтение из которого задерживается и расширяет окно гонки."""
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def get(self, *args, **kwargs):
+        value = self._cache.get(*args, **kwargs)
+        time.sleep(0.01)
+        return value
+
+
+def slow_reads():
+    return mock.patch.object(writebehind, 'cache', SlowReadCache(cache))
+
+
+@override_settings(POSTS_WRITE_BEHIND=True)
+class WriteBehindTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='wb_author')
+        self.reader = User.objects.create_user(username='wb_reader')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.addCleanup(writebehind.drain)
+
+    def queued(self):
+        """Запись только в очередь, без фонового потока."""
+        return mock.patch.object(writebehind, '_ensure_worker')
+
+    def test_comment_visible_to_author_before_write(self):
+        """Автор сразу видит свой комментарий, остальные — после записи"""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        with self.queued():
+            self.author_client.post(
+                reverse('posts:add_comment', args=[self.post.pk]),
+                {'text': 'Отложенный комментарий'}
+            )
+            self.assertFalse(Comment.objects.exists())
+            self.assertContains(
+                self.author_client.get(url), 'Отложенный комментарий'
+            )
+            self.assertNotContains(
+                self.reader_client.get(url), 'Отложенный комментарий'
+            )
+        writebehind._ensure_worker()
+        writebehind.drain()
+        self.assertEqual(
+            Comment.objects.get(post=self.post).text, 'Отложенный комментарий'
+        )
+        self.assertEqual(writebehind.pending_comments(
+            self.post.pk, self.author
+        ), [])
+        response = self.reader_client.get(url)
+        self.assertContains(response, 'Отложенный комментарий')
+        self.assertNotContains(response, 'Комментарий публикуется')
+
+    def test_concurrent_comments_all_pending(self):
+        """Одновременные комментарии не затирают друг друга в кэше"""
+        texts = [f'Комментарий {number}' for number in range(8)]
+        with self.queued(), slow_reads(), \
+                ThreadPoolExecutor(len(texts)) as executor:
+            list(executor.map(
+                lambda text: writebehind.add_comment(
+                    self.post.pk, self.author, text
+                ),
+                texts
+            ))
+        pending = writebehind.pending_comments(self.post.pk, self.author)
+        self.assertCountEqual(
+            [comment.text for comment in pending], texts
+        )
+        self.assertEqual(
+            writebehind.pending_comments(self.post.pk, self.reader), []
+        )
+        writebehind._ensure_worker()
+        writebehind.drain()
+        self.assertEqual(Comment.objects.count(), len(texts))
+        self.assertEqual(
+            writebehind.pending_comments(self.post.pk, self.author), []
+        )
+
+    def test_disabled_without_atomic_incr(self):
+        """На файловом кэше incr не атомарен, и запись идет сразу"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        file_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory,
+        }}
+        with self.settings(CACHES=file_cache):
+            self.assertFalse(writebehind.enabled())
+        self.assertTrue(writebehind.enabled())
+
+    def test_follow_and_unfollow_applied_in_order(self):
+        """Подписка видна сразу, а очередь сохраняет порядок операций"""
+        profile_url = reverse('posts:profile', args=[self.author.username])
+        with self.queued():
+            self.reader_client.get(
+                reverse('posts:profile_follow', args=[self.author.username])
+            )
+            self.assertFalse(Follow.objects.exists())
+            response = self.reader_client.get(profile_url)
+            self.assertTrue(response.context['following'])
+            self.reader_client.get(
+                reverse('posts:profile_unfollow', args=[self.author.username])
+            )
+            self.reader_client.get(
+                reverse('posts:profile_follow', args=[self.author.username])
+            )
+        writebehind._ensure_worker()
+        writebehind.drain()
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author
+        ).exists())
+        self.assertIsNone(
+            writebehind.pending_following(self.reader.pk, self.author.pk)
+        )
+
+    def test_failed_write_does_not_drop_batch(self):
+        """Запись об удаленном посте не откатывает остальную пачку"""
+        batch = [
+            (writebehind.write_comment,
+             (self.post.pk + 100, self.reader.pk, 'Потерянный', 'a')),
+            (writebehind.write_comment,
+             (self.post.pk, self.reader.pk, 'Записанный', 'b')),
+        ]
+        with self.assertLogs('posts.writebehind', 'ERROR'):
+            writebehind.write_batch(batch)
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            ['Записанный']
+        )
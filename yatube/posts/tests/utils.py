@@ -0,0 +1,25 @@
+from unittest import mock
+
+from django.db import transaction
+
+
+def run_immediately(func, using=None):
+    func()
+
+
+class OnCommitMixin:
+    """
+    Выполняет колбэки transaction.on_commit сразу.
+
+    TestCase оборачивает тест в транзакцию, которая не коммитится, и
+    версии лент и счетчики, которые меняются после коммита, иначе
+    остались бы прежними.
+    """
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        patcher = mock.patch.object(
+            transaction, 'on_commit', run_immediately
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
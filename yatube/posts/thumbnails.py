@@ -0,0 +1,235 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .counts import bump_feed_versions, feed_version_key
+from .fragments import invalidate_post_cards
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PrebuiltThumbnailBackend(ThumbnailBackend):
+    """
+    Бэкенд sorl-thumbnail, который в запросе только читает готовые миниатюры.
+
+    Если миниатюры еще нет, ее генерация ставится в фоновый пул, а шаблон
+    получает исходное изображение.
+    """
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, под которым она лежит в хранилище и kvstore."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+    def lookup_many(self, requests):
+        """
+        Готовые миниатюры для списка (файл, геометрия, опции) одним
+        обращением к kvstore; отсутствующие — None.
+        """
+        thumbnails = [
+            self.thumbnail_file(file_, geometry_string, **options)
+            for file_, geometry_string, options in requests
+        ]
+        if hasattr(default.kvstore, 'get_many'):
+            return default.kvstore.get_many(thumbnails)
+        return [default.kvstore.get(thumbnail) for thumbnail in thumbnails]
+
+    def generate(self, file_, geometry_string, **options):
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not settings.POSTS_THUMBNAILS_PREBUILT_ONLY:
+            return self.generate(file_, geometry_string, **options)
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        thumbnail = self.lookup(file_, geometry_string, **options)
+        if thumbnail:
+            return thumbnail
+        enqueue_thumbnail(
+            getattr(file_, 'name', file_), geometry_string, options
+        )
+        return ImageFile(file_)
+
+
+class BulkKVStore(KVStore):
+    """
+    kvstore sorl-thumbnail в кэше и базе с пакетным чтением.
+
+    get_many берет записи всех миниатюр страницы одним cache.get_many,
+    промахи дочитываются из базы одним запросом и кэшируются, в том числе
+    как отсутствующие.
+    """
+
+    def get_many(self, image_files):
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            stored = dict(
+                KVStoreModel.objects.filter(
+                    key__in=missing
+                ).values_list('key', 'value')
+            )
+            values.update(stored)
+            self.cache.set_many(
+                {key: stored.get(key, EMPTY_VALUE) for key in missing},
+                thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+        return [
+            None if values.get(key) in (None, EMPTY_VALUE)
+            else deserialize_image_file(values[key])
+            for key in keys
+        ]
+
+
+def format_supported(image_format):
+    if image_format == 'WEBP':
+        return features.check('webp')
+    return True
+
+
+def thumbnail_specs():
+    """Миниатюры из POSTS_THUMBNAIL_SPECS в форматах, доступных Pillow."""
+    return [
+        (geometry_string, options)
+        for geometry_string, options in settings.POSTS_THUMBNAIL_SPECS
+        if format_supported(options.get('format', 'JPEG'))
+    ]
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.POSTS_THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def drain():
+    """Дожидается всех поставленных в очередь миниатюр."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def variants_ready(name):
+    """Созданы ли все миниатюры картинки из thumbnail_specs."""
+    return all(default.backend.lookup_many([
+        (name, geometry_string, dict(options))
+        for geometry_string, options in thumbnail_specs()
+    ]))
+
+
+def refresh_post_cards(name):
+    """
+    Сбрасывает карточки и версии лент постов с картинкой.
+
+    Карточка, отрисованная до появления миниатюр, закэширована с исходным
+    файлом без srcset; после последней миниатюры ее нужно перерисовать.
+    """
+    posts = list(Post.objects.filter(image=name).values_list(
+        'pk', 'author_id', 'group_id'
+    ))
+    if not posts:
+        return
+    invalidate_post_cards([pk for pk, _, _ in posts])
+    keys = {feed_version_key('all')}
+    for pk, author_id, group_id in posts:
+        keys.add(feed_version_key('post', pk))
+        keys.add(feed_version_key('author', author_id))
+        if group_id is not None:
+            keys.add(feed_version_key('group', group_id))
+    bump_feed_versions(keys)
+
+
+def generate_thumbnail(name, geometry_string, options):
+    try:
+        default.backend.generate(name, geometry_string, **options)
+        if variants_ready(name):
+            refresh_post_cards(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', name)
+
+
+def generate_in_worker(name, geometry_string, options, lock_key=None):
+    try:
+        generate_thumbnail(name, geometry_string, options)
+    finally:
+        if lock_key is not None:
+            cache.delete(lock_key)
+        connections.close_all()
+
+
+def thumbnail_lock_key(name, geometry_string, options):
+    thumbnail = default.backend.thumbnail_file(
+        name, geometry_string, **options
+    )
+    return f'thumbnail:{thumbnail.key}:lock'
+
+
+def enqueue_thumbnail(name, geometry_string, options):
+    """
+    Ставит миниатюру в фоновый пул или создает ее в текущем потоке.
+
+    Пока миниатюра создается, ее ключ занят через cache.add, и повторные
+    промахи по ней из других запросов и воркеров ничего не ставят в пул.
+    """
+    lock_key = thumbnail_lock_key(name, geometry_string, dict(options))
+    if not cache.add(
+        lock_key, True, settings.POSTS_THUMBNAIL_LOCK_TIMEOUT
+    ):
+        return
+    if settings.POSTS_THUMBNAIL_WORKERS:
+        get_executor().submit(
+            generate_in_worker, name, geometry_string, dict(options),
+            lock_key
+        )
+        return
+    try:
+        generate_thumbnail(name, geometry_string, dict(options))
+    finally:
+        cache.delete(lock_key)
+
+
+def enqueue_post_thumbnails(post):
+    """Ставит в очередь все миниатюры, которые используют шаблоны."""
+    if not post.image:
+        return
+    for geometry_string, options in thumbnail_specs():
+        enqueue_thumbnail(post.image.name, geometry_string, options)
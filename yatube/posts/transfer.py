@@ -0,0 +1,277 @@
+import csv
+import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+
+from .counters import create_missing_profiles, reconcile_counters
+from .feed import backfill_feed
+from .models import Comment, Follow, Group, Post
+from .search import rebuild_index
+
+MODELS = {
+    'group': Group,
+    'post': Post,
+    'comment': Comment,
+    'follow': Follow,
+}
+# Модели одного этапа не ссылаются друг на друга и грузятся параллельно,
+# следующий этап начинается, когда загружены все его внешние ключи
+IMPORT_STAGES = (('group',), ('post', 'follow'), ('comment',))
+FORMATS = ('jsonl', 'csv')
+
+
+def field_names(model):
+    """Колонки выгрузки: все поля таблицы, первым идет первичный ключ."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def data_path(directory, name, fmt):
+    return os.path.join(directory, f'{name}.{fmt}')
+
+
+class Checkpoint:
+    """
+    Прогресс по моделям в JSON-файле.
+
+    Файл переписывается после каждой пачки, поэтому прерванную команду
+    можно запустить еще раз и она продолжит с последней записанной пачки.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.state = json.load(file)
+
+    def get(self, name):
+        with self.lock:
+            return self.state.get(name)
+
+    def set(self, name, value):
+        with self.lock:
+            self.state[name] = value
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump(self.state, file)
+            os.replace(temporary, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def serialize_value(value):
+    # isoformat сохраняет микросекунды, которые DjangoJSONEncoder обрезает
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def export_model(name, directory, fmt, batch_size, checkpoint, progress):
+    """
+    Выгружает таблицу пачками по первичному ключу.
+
+    Каждая пачка — отдельный запрос с pk > последнего выгруженного,
+    так что память не растет с размером таблицы. После пачки в контрольной
+    точке запоминаются ключ и длина файла: при повторном запуске файл
+    обрезается до нее, и недописанная пачка не задваивается.
+    """
+    model = MODELS[name]
+    fields = field_names(model)
+    state = checkpoint.get(name) or {'pk': None, 'offset': 0, 'rows': 0}
+    last_pk, total = state['pk'], state['rows']
+    queryset = model._default_manager.order_by('pk').values_list(*fields)
+    path = data_path(directory, name, fmt)
+    with open(path, 'a+b') as file:
+        file.truncate(state['offset'])
+        file.seek(state['offset'])
+        if fmt == 'csv' and not state['offset']:
+            file.write(csv_line(fields))
+        while True:
+            batch = queryset
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            rows = list(batch[:batch_size])
+            if not rows:
+                break
+            for row in rows:
+                values = [serialize_value(value) for value in row]
+                if fmt == 'csv':
+                    file.write(csv_line(
+                        '' if value is None else value for value in values
+                    ))
+                else:
+                    file.write(json.dumps(
+                        dict(zip(fields, values)), ensure_ascii=False
+                    ).encode() + b'\n')
+            file.flush()
+            last_pk = rows[-1][0]
+            total += len(rows)
+            checkpoint.set(
+                name, {'pk': last_pk, 'offset': file.tell(), 'rows': total}
+            )
+            progress(name, total)
+    return total
+
+
+class _Line:
+    def __init__(self):
+        self.value = ''
+
+    def write(self, value):
+        self.value = value
+
+
+def csv_line(values):
+    line = _Line()
+    csv.writer(line).writerow(values)
+    return line.value.encode()
+
+
+def read_lines(file, position):
+    """Строки файла с подсчетом прочитанных байт в position[0]."""
+    for line in file:
+        position[0] += len(line)
+        yield line.decode('utf-8')
+
+
+def read_records(path, fmt, offset):
+    """
+    Записи файла, начиная с байтового смещения, вместе со смещением
+    сразу после каждой записи.
+    """
+    position = [0]
+    with open(path, 'rb') as file:
+        lines = read_lines(file, position)
+        if fmt == 'csv':
+            reader = csv.reader(lines)
+            header = next(reader, None)
+            if header is None:
+                return
+            if offset > position[0]:
+                file.seek(offset)
+                position[0] = offset
+            for row in reader:
+                yield dict(zip(header, row)), position[0]
+        else:
+            file.seek(offset)
+            position[0] = offset
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line), position[0]
+
+
+def build_object(model, record):
+    values = {}
+    for field in model._meta.concrete_fields:
+        value = record.get(field.attname)
+        if value == '' and field.null:
+            value = None
+        values[field.attname] = field.to_python(value)
+    return model(**values)
+
+
+@contextmanager
+def original_dates():
+    """
+    Отключает auto_now_add, иначе bulk_create заменит даты из выгрузки
+    текущим временем. Меняет поля моделей на весь процесс, поэтому
+    подходит только для команд управления.
+    """
+    fields = [
+        field
+        for model in MODELS.values()
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def import_model(name, directory, fmt, batch_size, checkpoint, progress):
+    """
+    Загружает файл модели пачками через bulk_create.
+
+    Уже существующие строки пропускаются, так что повторная загрузка
+    пачки после сбоя безопасна. Сигналы при этом не отправляются —
+    производные данные пересчитывает rebuild_derived.
+    """
+    model = MODELS[name]
+    path = data_path(directory, name, fmt)
+    if not os.path.exists(path):
+        return 0
+    state = checkpoint.get(name) or {'offset': 0, 'rows': 0}
+    total = state['rows']
+    batch = []
+
+    def flush(offset):
+        nonlocal total
+        with transaction.atomic():
+            model._default_manager.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+        batch.clear()
+        checkpoint.set(name, {'offset': offset, 'rows': total})
+        progress(name, total)
+
+    offset = state['offset']
+    for record, offset in read_records(path, fmt, state['offset']):
+        batch.append(build_object(model, record))
+        if len(batch) >= batch_size:
+            flush(offset)
+    if batch:
+        flush(offset)
+    return total
+
+
+def reset_sequences(names):
+    """После загрузки с явными ключами сдвигает счетчики id (PostgreSQL)."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [MODELS[name] for name in names]
+    )
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def rebuild_derived():
+    """Ленты подписок, поиск и счетчики в таблицах и кэше после загрузки."""
+    create_missing_profiles()
+    reconcile_counters()
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        backfill_feed(user_id, author_id)
+    rebuild_index()
+    cache.clear()
+
+
+def in_worker(function, *args):
+    try:
+        return function(*args)
+    finally:
+        connections.close_all()
+
+
+def run_stage(function, names, workers, *args):
+    """Обрабатывает модели этапа, при workers > 1 — в отдельных потоках."""
+    if workers <= 1 or len(names) == 1:
+        return {name: function(name, *args) for name in names}
+    with ThreadPoolExecutor(min(workers, len(names))) as executor:
+        futures = {
+            name: executor.submit(in_worker, function, name, *args)
+            for name in names
+        }
+        return {name: future.result() for name, future in futures.items()}
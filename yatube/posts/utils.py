@@ -1,10 +1,215 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db.models import Q
+
+from core.cache import get_or_set_locked
+from .counts import CachedCountPaginator, feed_cache_key, feed_version
+from .images import prefetch_image_variants
+from .models import Comment
 
 
 ORDER_COUNT = 10
 
 
-def pagination(request, posts, number_of_posts):
-    paginator = Paginator(posts, number_of_posts)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+class CursorPage(Sequence):
+    """Страница keyset-пагинации, совместимая с шаблоном паджинатора."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage: %s objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+class CursorPaginator:
+    """
+    Пагинация по ключу (поле сортировки, pk) без COUNT(*) и OFFSET.
+
+    Курсор — непрозрачный токен с последним ключом страницы и направлением,
+    поэтому стоимость запроса не зависит от глубины страницы.
+    """
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        model = object_list.model
+        ordering = ordering or model._meta.ordering[0]
+        self.descending = ordering.startswith('-')
+        self.field = model._meta.get_field(ordering.lstrip('-'))
+
+    def encode_cursor(self, obj, reverse=False):
+        value = self.field.value_to_string(obj)
+        payload = json.dumps([value, obj.pk, int(reverse)])
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return token.rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            value, pk, reverse = json.loads(
+                base64.urlsafe_b64decode(padded.encode()).decode()
+            )
+            return self.field.to_python(value), int(pk), bool(reverse)
+        except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+            return None
+
+    def _order_by(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return (prefix + self.field.name, prefix + 'pk'), descending
+
+    def _after(self, value, pk, descending):
+        lookup = 'lt' if descending else 'gt'
+        name = self.field.name
+        return (
+            Q(**{f'{name}__{lookup}': value})
+            | Q(**{name: value, f'pk__{lookup}': pk})
+        )
+
+    def get_page(self, cursor=None):
+        """Возвращает страницу; неверный курсор ведет на первую страницу."""
+        key = self.decode_cursor(cursor) if cursor else None
+        reverse = bool(key and key[2])
+        order_by, descending = self._order_by(reverse)
+        queryset = self.object_list.order_by(*order_by)
+        if key:
+            queryset = queryset.filter(self._after(key[0], key[1], descending))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else key is not None
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+def elided_page_range(page, on_each_side=None, on_ends=None):
+    """
+    Номера страниц вокруг текущей, первые и последние, с None на месте
+    пропусков.
+
+    Длина результата не больше 2 * (on_each_side + on_ends) + 3 при любом
+    числе страниц, а page_range паджинатора не перебирается.
+    """
+    if on_each_side is None:
+        on_each_side = settings.POSTS_PAGINATOR_ON_EACH_SIDE
+    if on_ends is None:
+        on_ends = settings.POSTS_PAGINATOR_ON_ENDS
+    number, num_pages = page.number, page.paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        return list(range(1, num_pages + 1))
+    pages = []
+    if number > on_each_side + on_ends + 2:
+        pages.extend(range(1, on_ends + 1))
+        pages.append(None)
+        pages.extend(range(number - on_each_side, number + 1))
+    else:
+        pages.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        pages.extend(range(number + 1, number + on_each_side + 1))
+        pages.append(None)
+        pages.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        pages.extend(range(number + 1, num_pages + 1))
+    return pages
+
+
+def cached_page(paginator, number, cache_key):
+    """
+    Аналог Paginator.get_page, который хранит объекты страницы в кэше.
+
+    Пересчет страницы защищен от одновременных запросов, поэтому смена
+    версии горячей ленты не приводит к лавине одинаковых запросов в базу.
+    """
+    try:
+        number = paginator.validate_number(number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+    object_list = get_or_set_locked(
+        f'{cache_key}:{number}',
+        lambda: list(paginator.page(number).object_list),
+        settings.POSTS_PAGE_CACHE_TIMEOUT
+    )
+    return paginator._get_page(object_list, number, paginator)
+
+
+def pagination(request, posts, number_of_posts, count_key=None,
+               approximate=False, page_cache_key=None):
+    cursor = request.GET.get('cursor')
+    if cursor is not None or settings.POSTS_CURSOR_PAGINATION:
+        page = CursorPaginator(posts, number_of_posts).get_page(cursor)
+    else:
+        paginator = CachedCountPaginator(
+            posts, number_of_posts, count_key=count_key,
+            approximate=approximate
+        )
+        page_number = request.GET.get('page')
+        if page_cache_key is not None:
+            page = cached_page(paginator, page_number, page_cache_key)
+        else:
+            page = paginator.get_page(page_number)
+    page.object_list = prefetch_image_variants(page.object_list)
+    return page
+
+
+def comments_page(post_id, cursor=None):
+    """
+    Порция комментариев поста по курсору.
+
+    Первая порция открывается с каждым просмотром поста, поэтому хранится
+    в кэше под версией поста; новый или удаленный комментарий меняет
+    версию, и порция пересчитывается.
+    """
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.POSTS_COMMENTS_PER_PAGE
+    )
+    if cursor:
+        return paginator.get_page(cursor)
+
+    def first_page():
+        page = paginator.get_page()
+        return list(page.object_list), page.next_cursor
+
+    object_list, next_cursor = get_or_set_locked(
+        '{}:{}'.format(
+            feed_cache_key('comments', 'post', post_id),
+            feed_version('post', post_id)
+        ),
+        first_page,
+        settings.POSTS_PAGE_CACHE_TIMEOUT
+    )
+    return CursorPage(object_list, paginator, next_cursor, None)
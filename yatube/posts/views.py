@@ -1,32 +1,55 @@
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
+from django.utils.http import urlencode
 
 from .models import Post, Group, Follow
+from . import etags, writebehind
+from .counts import (
+    feed_cache_key, feed_count_key, feed_version
+)
+from .feed import follow_count_key, follow_feed
 from .forms import PostForm, CommentForm
-from .utils import pagination
+from .search import search_posts
+from .syndication import FEED_FORMATS, FeedSource, feed_response
+from .thumbnails import enqueue_post_thumbnails
+from .utils import comments_page, pagination
 
 
 User = get_user_model()
 ORDER_COUNT = 10
 
 
-@cache_page(20)
+@condition(etag_func=etags.index_etag)
 def index(request):
-    post_list = Post.objects.select_related('group', 'author')
-    page_obj = pagination(request, post_list, ORDER_COUNT)
+    post_list = Post.objects.for_listing()
+    page_obj = pagination(
+        request, post_list, ORDER_COUNT,
+        count_key=feed_count_key('all'),
+        approximate=settings.POSTS_APPROXIMATE_COUNT,
+        page_cache_key='{}:{}'.format(
+            feed_cache_key('page', 'all'), feed_version('all')
+        )
+    )
     context = {
         'page_obj': page_obj
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=etags.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = pagination(request, posts, ORDER_COUNT)
+    posts = group.posts.for_listing()
+    page_obj = pagination(
+        request, posts, ORDER_COUNT,
+        count_key=feed_count_key('group', group.pk)
+    )
     context = {
         'group': group,
         'page_obj': page_obj
@@ -35,44 +58,67 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@condition(etag_func=etags.profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    author_posts = author.posts.all()
-    page_obj = pagination(request, author_posts, ORDER_COUNT)
+    author = get_object_or_404(
+        User.objects.select_related('profile'), username=username
+    )
+    author_posts = author.posts.for_listing()
+    page_obj = pagination(
+        request, author_posts, ORDER_COUNT,
+        count_key=feed_count_key('author', author.pk)
+    )
+    following = False
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author
-        ).exists()
-    else:
-        following = False
+        following = writebehind.pending_following(request.user.pk, author.pk)
+        if following is None:
+            following = Follow.objects.filter(
+                user=request.user, author=author
+            ).exists()
     context = {
         'author': author,
         'following': following,
-        'page_obj': page_obj
+        'page_obj': page_obj,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=etags.post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.objects.for_detail(), id=post_id)
     form = CommentForm(request.POST)
-    comments = post.comments.all()
+    comments = comments_page(post.pk, request.GET.get('comments'))
     context = {
         'post': post,
         'form': form,
         'post_id': post_id,
-        'comments': comments
+        'comments': comments,
+        'pending_comments': writebehind.pending_comments(
+            post.pk, request.user
+        ),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@condition(etag_func=etags.post_etag)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать еще»."""
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    context = {
+        'post': post,
+        'comments': comments_page(post.pk, request.GET.get('cursor')),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
-        form = form.save(commit=False)
-        form.author = request.user
-        form.save()
+        post = form.save(commit=False)
+        post.author = request.user
+        post.save()
+        transaction.on_commit(lambda: enqueue_post_thumbnails(post))
         return redirect('posts:profile', username=request.user.username)
     context = {
         'form': form,
@@ -91,7 +137,12 @@ def post_edit(request, post_id):
     if request.user != post.author:
         return redirect('posts:post_detail', post_id)
     if form.is_valid():
-        form.save()
+        # Только поля формы: счетчик комментариев меняется параллельно
+        # через F() и не должен перезаписываться значением из формы
+        post = form.save(commit=False)
+        post.save(update_fields=PostForm.Meta.fields)
+        if 'image' in form.changed_data:
+            transaction.on_commit(lambda: enqueue_post_thumbnails(post))
         return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -104,7 +155,11 @@ def post_edit(request, post_id):
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
-    if form.is_valid():
+    if form.is_valid() and writebehind.enabled():
+        writebehind.add_comment(
+            post.pk, request.user, form.cleaned_data['text']
+        )
+    elif form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
@@ -114,8 +169,11 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    list_of_posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = pagination(request, list_of_posts, ORDER_COUNT)
+    list_of_posts = follow_feed(request.user).for_listing()
+    page_obj = pagination(
+        request, list_of_posts, ORDER_COUNT,
+        count_key=follow_count_key(request.user.pk)
+    )
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
@@ -123,16 +181,87 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     user = request.user
-    author = User.objects.get(username=username)
-    is_follower = Follow.objects.filter(user=user, author=author)
-    if user != author and not is_follower.exists():
-        Follow.objects.create(user=user, author=author)
+    author = get_object_or_404(User, username=username)
+    if user != author and writebehind.enabled():
+        writebehind.set_following(user.pk, author.pk, True)
+    elif user != author:
+        # Одновременные запросы не создадут вторую подписку: INSERT
+        # упирается в unique_follow, и get_or_create читает готовую строку.
+        # bulk_create(ignore_conflicts=True) не подходит — без сигналов
+        # не обновятся счетчики и лента подписок
+        Follow.objects.get_or_create(user=user, author=author)
     return redirect(reverse('posts:profile', args=[username]))
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
+    if writebehind.enabled():
+        writebehind.set_following(request.user.pk, author.pk, False)
+        return redirect('posts:profile', username=author)
     is_follower = Follow.objects.filter(user=request.user, author=author)
     is_follower.delete()
     return redirect('posts:profile', username=author)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    filters = {
+        'group': request.GET.get('group', ''),
+        'author': request.GET.get('author', ''),
+    }
+    group_id = author_id = None
+    if filters['group']:
+        group_id = get_object_or_404(Group, slug=filters['group']).pk
+    if filters['author']:
+        author_id = get_object_or_404(User, username=filters['author']).pk
+    page_obj = search_posts(
+        query, group_id=group_id, author_id=author_id,
+        cursor=request.GET.get('cursor'), per_page=ORDER_COUNT
+    )
+    next_url = None
+    if page_obj.has_next():
+        next_url = '?' + urlencode(
+            dict(filters, q=query, cursor=page_obj.next_cursor)
+        )
+    context = {
+        'query': query,
+        'filters': filters,
+        'page_obj': page_obj,
+        'next_url': next_url,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def check_feed_format(fmt):
+    if fmt not in FEED_FORMATS:
+        raise Http404('Неизвестный формат ленты')
+
+
+def index_feed(request, fmt):
+    check_feed_format(fmt)
+    source = FeedSource(
+        'all', None, 'Последние обновления на сайте',
+        reverse('posts:index'), Post.objects.for_listing()
+    )
+    return feed_response(request, source, fmt)
+
+
+def group_feed(request, slug, fmt):
+    check_feed_format(fmt)
+    group = get_object_or_404(Group, slug=slug)
+    source = FeedSource(
+        'group', group.pk, group.title,
+        reverse('posts:group_list', args=[slug]), group.posts.for_listing()
+    )
+    return feed_response(request, source, fmt)
+
+
+def profile_feed(request, username, fmt):
+    check_feed_format(fmt)
+    author = get_object_or_404(User, username=username)
+    source = FeedSource(
+        'author', author.pk, f'Записи пользователя {username}',
+        reverse('posts:profile', args=[username]), author.posts.for_listing()
+    )
+    return feed_response(request, source, fmt)
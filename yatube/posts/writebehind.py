@@ -0,0 +1,215 @@
+import atexit
+import logging
+import queue
+import threading
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from core.cache import has_atomic_incr
+from .counts import bump_feed_versions, feed_cache_key, feed_version_key
+from .models import Comment, Follow
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enabled():
+    """
+    Включена ли отложенная запись.
+
+    Слоты комментариев нумерует cache.incr, поэтому на кэше без
+    атомарного incr отложенная запись не включается.
+    """
+    if not settings.POSTS_WRITE_BEHIND:
+        return False
+    if not has_atomic_incr():
+        _warn_not_atomic()
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def _warn_not_atomic():
+    logger.warning(
+        'POSTS_WRITE_BEHIND выключен: у кэша нет атомарного incr'
+    )
+
+
+def comments_key(post_id, user_id):
+    return feed_cache_key('pending', 'comments', f'{post_id}:{user_id}')
+
+
+def follow_key(user_id, author_id):
+    return feed_cache_key('pending', 'follows', f'{user_id}:{author_id}')
+
+
+def add_comment(post_id, author, text):
+    """
+    Ставит комментарий в очередь записи.
+
+    До записи комментарий лежит в кэше, и автор видит его на странице
+    поста. Каждый комментарий занимает свой ключ-слот, номер которого
+    выдает cache.incr, поэтому одновременные комментарии не затирают друг
+    друга; enabled() допускает только кэши с атомарным incr. Версия
+    поста меняется сразу, чтобы браузер автора не получил 304 со
+    страницей без комментария.
+    """
+    timeout = settings.POSTS_WRITE_BEHIND_PENDING_TIMEOUT
+    key = comments_key(post_id, author.pk)
+    cache.add(key, 0, timeout)
+    slot = f'{key}:{cache.incr(key)}'
+    cache.touch(key, timeout)
+    cache.set(slot, {'text': text, 'created': timezone.now()}, timeout)
+    bump_feed_versions([feed_version_key('post', post_id)])
+    _enqueue(write_comment, post_id, author.pk, text, slot)
+
+
+def set_following(user_id, author_id, following):
+    """Ставит в очередь подписку (following=True) или отписку."""
+    token = uuid.uuid4().hex
+    cache.set(
+        follow_key(user_id, author_id), (following, token),
+        settings.POSTS_WRITE_BEHIND_PENDING_TIMEOUT
+    )
+    bump_feed_versions([feed_version_key('author', author_id)])
+    _enqueue(write_follow, user_id, author_id, following, token)
+
+
+def pending_comments(post_id, user):
+    """Еще не записанные комментарии пользователя к посту."""
+    if not enabled() or not user.is_authenticated:
+        return []
+    key = comments_key(post_id, user.pk)
+    slots = [f'{key}:{number}' for number in range(1, cache.get(key, 0) + 1)]
+    entries = cache.get_many(slots)
+    return [
+        Comment(
+            post_id=post_id, author=user,
+            text=entries[slot]['text'], created=entries[slot]['created']
+        )
+        for slot in slots if slot in entries
+    ]
+
+
+def pending_following(user_id, author_id):
+    """Состояние подписки из очереди или None, если записей нет."""
+    if not enabled():
+        return None
+    pending = cache.get(follow_key(user_id, author_id))
+    return None if pending is None else pending[0]
+
+
+def write_comment(post_id, author_id, text, slot):
+    Comment.objects.create(post_id=post_id, author_id=author_id, text=text)
+    return lambda: cache.delete(slot)
+
+
+def write_follow(user_id, author_id, following, token):
+    if following:
+        Follow.objects.get_or_create(user_id=user_id, author_id=author_id)
+    else:
+        Follow.objects.filter(user_id=user_id, author_id=author_id).delete()
+    return lambda: _forget_follow(user_id, author_id, token)
+
+
+def _forget_follow(user_id, author_id, token):
+    # Более новая операция с тем же автором остается в очереди
+    key = follow_key(user_id, author_id)
+    pending = cache.get(key)
+    if pending is not None and pending[1] == token:
+        cache.delete(key)
+
+
+def _enqueue(writer, *args):
+    _queue.put((writer, args))
+    _ensure_worker()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_run, name='write-behind', daemon=True
+            )
+            _worker.start()
+
+
+def _next_batch():
+    batch = [_queue.get()]
+    while len(batch) < settings.POSTS_WRITE_BEHIND_BATCH_SIZE:
+        try:
+            batch.append(
+                _queue.get(timeout=settings.POSTS_WRITE_BEHIND_LINGER)
+            )
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write(batch):
+    done = []
+    with transaction.atomic():
+        for writer, args in batch:
+            try:
+                with transaction.atomic():
+                    done.append(writer(*args))
+            except DatabaseError:
+                logger.exception(
+                    'Не удалось выполнить %s%r', writer.__name__, args
+                )
+    return done
+
+
+def write_batch(batch):
+    """
+    Записывает пачку в одной транзакции.
+
+    Каждая запись идет в своей точке сохранения, и ее ошибка откатывает
+    только ее. Отложенные проверки внешних ключей (SQLite, PostgreSQL)
+    срабатывают при коммите всей пачки — тогда пачка повторяется по одной
+    записи. Отметки в кэше снимаются после коммита.
+    """
+    try:
+        done = _write(batch)
+    except DatabaseError:
+        done = []
+        for item in batch:
+            try:
+                done.extend(_write([item]))
+            except DatabaseError:
+                logger.exception(
+                    'Не удалось выполнить %s%r', item[0].__name__, item[1]
+                )
+    for forget in done:
+        forget()
+
+
+def _run():
+    while True:
+        batch = _next_batch()
+        try:
+            close_old_connections()
+            write_batch(batch)
+        except Exception:
+            logger.exception('Не удалось записать пачку из %s', len(batch))
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def drain():
+    """Дожидается записи всего, что стоит в очереди."""
+    if _worker is not None and _worker.is_alive():
+        _queue.join()
+
+
+atexit.register(drain)
@@ -62,6 +62,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestStatsMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,19 +93,106 @@ TEMPLATES = [
     },
 ]
 
+# Замеры запросов к базе, шаблонов и размера ответа для каждой страницы:
+# заголовок Server-Timing и сводка p50/p95/p99 на /debug/stats/
+REQUEST_STATS_ENABLED = os.getenv('YATUBE_REQUEST_STATS', '') == '1'
+REQUEST_STATS_WINDOW = 1000
+if REQUEST_STATS_ENABLED:
+    TEMPLATES[0]['BACKEND'] = 'core.template_backends.TimedDjangoTemplates'
+
+# Кэширующий загрузчик разбирает каждый шаблон один раз на процесс.
+# По умолчанию включен без DEBUG; TEMPLATES_PRECOMPILE загружает все
+# шаблоны при старте. TEMPLATE_PROFILING заменяет его профилирующим
+# загрузчиком: время каждого шаблона и include на /debug/templates/
+TEMPLATE_CACHE = os.getenv(
+    'YATUBE_TEMPLATE_CACHE', '0' if DEBUG else '1'
+) == '1'
+TEMPLATE_PROFILING = os.getenv('YATUBE_TEMPLATE_PROFILING', '') == '1'
+TEMPLATES_PRECOMPILE = TEMPLATE_CACHE and os.getenv(
+    'YATUBE_TEMPLATE_PRECOMPILE', '1'
+) == '1'
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if TEMPLATE_PROFILING:
+    TEMPLATE_LOADERS = [
+        ('core.template_loaders.ProfilingLoader', TEMPLATE_LOADERS)
+    ]
+elif TEMPLATE_CACHE:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)
+    ]
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = TEMPLATE_LOADERS
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+# Бэкенды из core.db держат соединения в пуле (POOL): закрытие в конце
+# запроса возвращает соединение в пул, и следующий запрос не тратит время
+# на подключение. CONN_MAX_AGE включает постоянные соединения Django
+# и без пула. Для SQLite дополнительно задаются PRAGMA (режим WAL и др.)
+DATABASE_POOL = {
+    'size': int(os.getenv('YATUBE_DB_POOL_SIZE', 10)),
+    'max_lifetime': int(os.getenv('YATUBE_DB_POOL_MAX_LIFETIME', 600)),
+    'health_check_after': int(
+        os.getenv('YATUBE_DB_POOL_HEALTH_CHECK_AFTER', 30)
+    ),
 }
 
+if os.getenv('YATUBE_DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.db.backends.postgresql',
+            'NAME': os.getenv('YATUBE_DB_NAME', 'yatube'),
+            'USER': os.getenv('YATUBE_DB_USER', ''),
+            'PASSWORD': os.getenv('YATUBE_DB_PASSWORD', ''),
+            'HOST': os.getenv('YATUBE_DB_HOST', ''),
+            'PORT': os.getenv('YATUBE_DB_PORT', ''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        }
+    }
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.getenv('YATUBE_CONN_MAX_AGE', 0)
+)
+if os.getenv('YATUBE_DB_POOL', '1') == '1':
+    DATABASES['default']['POOL'] = DATABASE_POOL
+
+# Реплики для чтения: YATUBE_DB_REPLICAS — через запятую файлы SQLite
+# (локально можно указать тот же файл, что и у основной базы) или хосты
+# PostgreSQL. Соединения с репликами SQLite только читают (query_only)
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('YATUBE_DB_REPLICAS', '').split(',')), 1
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'], TEST={'MIRROR': 'default'}
+    )
+    if DATABASES['default']['ENGINE'] == 'core.db.backends.sqlite3':
+        DATABASES[alias]['NAME'] = replica
+        DATABASES[alias]['PRAGMAS'] = {
+            'busy_timeout': 5000,
+            'query_only': 'ON',
+        }
+    else:
+        DATABASES[alias]['HOST'] = replica
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# После записи клиент читает с основной базы, пока реплики догоняют
+REPLICA_PIN_COOKIE = 'pin_primary'
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -149,8 +238,147 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
+# Бэкенд кэша выбирается переменной окружения YATUBE_CACHE. Для нескольких
+# воркеров нужен общий кэш: file, db (таблица создается командой
+# createcachetable) или memcached. При YATUBE_CACHE_TWO_TIER общий кэш
+# становится вторым уровнем за кэшем в памяти процесса.
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.getenv('YATUBE_CACHE_LOCATION', 'yatube_cache'),
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.getenv('YATUBE_CACHE_LOCATION', '127.0.0.1:11211'),
+    },
+}
+CACHE_BACKEND = os.getenv('YATUBE_CACHE', 'locmem')
+
+if os.getenv('YATUBE_CACHE_TWO_TIER'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': 5},
+        },
+        'shared': CACHE_BACKENDS[CACHE_BACKEND],
+    }
+else:
+    CACHES = {
+        'default': CACHE_BACKENDS[CACHE_BACKEND],
     }
+
+# Keyset-пагинация лент по (pub_date, id): при True все ленты отдают
+# ?cursor= токены вместо номеров страниц
+POSTS_CURSOR_PAGINATION = False
+# Паджинатор показывает соседей текущей страницы и края ленты, остальные
+# номера заменяются многоточием
+POSTS_PAGINATOR_ON_EACH_SIDE = 2
+POSTS_PAGINATOR_ON_ENDS = 1
+# Комментарии поста выводятся порциями, следующие подгружаются по курсору
+POSTS_COMMENTS_PER_PAGE = 20
+
+# Число постов в лентах хранится в кэше и обновляется сигналами,
+# поэтому паджинатор не выполняет COUNT(*) на каждый запрос
+POSTS_COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+# Для главной ленты на очень больших таблицах можно брать оценку
+# числа строк вместо точного значения; после удалений постов последние
+# страницы при этом могут оказаться пустыми
+POSTS_APPROXIMATE_COUNT = False
+
+# Лента подписок материализуется при публикации поста; авторы с большим
+# числом подписчиков читаются при запросе ленты
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+# Новый подписчик получает в ленту столько последних постов автора,
+# более старые остаются только в профиле
+FEED_BACKFILL_SIZE = 500
+FEED_BATCH_SIZE = 500
+
+# Время жизни закэшированных страниц главной ленты; страницы сбрасываются
+# сменой версии ленты при изменении постов
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Миниатюры картинок постов создаются фоновым пулом после загрузки,
+# а в запросе только читаются из хранилища sorl-thumbnail
+THUMBNAIL_BACKEND = 'posts.thumbnails.PrebuiltThumbnailBackend'
+# Записи о миниатюрах читаются из кэша пачкой на всю страницу, база
+# нужна только при промахе
+THUMBNAIL_KVSTORE = 'posts.thumbnails.BulkKVStore'
+POSTS_THUMBNAILS_PREBUILT_ONLY = True
+POSTS_THUMBNAIL_WORKERS = int(os.getenv('YATUBE_THUMBNAIL_WORKERS', 2))
+# Сколько секунд миниатюра считается создающейся: повторные промахи по
+# ней в это время не ставят ее в пул еще раз
+POSTS_THUMBNAIL_LOCK_TIMEOUT = 60
+# Ширины адаптивных вариантов картинки для srcset с пропорцией карточки.
+# WEBP пропускается, если Pillow собран без его поддержки
+POSTS_IMAGE_WIDTHS = [480, 960, 1440]
+POSTS_IMAGE_ASPECT = (960, 339)
+POSTS_IMAGE_FORMATS = ['WEBP', 'JPEG']
+POSTS_THUMBNAIL_SPECS = [
+    (
+        '{}x{}'.format(
+            width, width * POSTS_IMAGE_ASPECT[1] // POSTS_IMAGE_ASPECT[0]
+        ),
+        {'crop': 'center', 'format': image_format},
+    )
+    for image_format in POSTS_IMAGE_FORMATS
+    for width in POSTS_IMAGE_WIDTHS
+]
+
+# Загрузки пишутся во временный файл частями, а не читаются в память.
+# Картинка больше лимитов отклоняется по заголовку, без декодирования;
+# вместо оригинала хранится копия, уменьшенная до POSTS_IMAGE_MASTER_SIZE
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+POSTS_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+# Поля формы без файлов, как по умолчанию в Django
+DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440
+POSTS_IMAGE_MAX_PIXELS = 50_000_000
+POSTS_IMAGE_MASTER_SIZE = 2048
+POSTS_IMAGE_QUALITY = 85
+
+# Полнотекстовый поиск: fts5 (виртуальная таблица SQLite), inverted
+# (таблица SearchTerm для любой базы) или auto — fts5, если он доступен.
+# После смены бэкенда индекс перестраивается командой rebuild_search_index
+POSTS_SEARCH_BACKEND = 'auto'
+POSTS_SEARCH_MAX_RESULTS = 1000
+
+# Отложенная запись: комментарии и подписки ставятся в очередь процесса,
+# а фоновый поток записывает их пачками в одной транзакции. До записи
+# автор видит свой комментарий или подписку по отметкам в кэше
+POSTS_WRITE_BEHIND = os.getenv('YATUBE_WRITE_BEHIND', '') == '1'
+POSTS_WRITE_BEHIND_BATCH_SIZE = 100
+# Сколько секунд поток ждет следующую запись, прежде чем закрыть пачку
+POSTS_WRITE_BEHIND_LINGER = 0.02
+POSTS_WRITE_BEHIND_PENDING_TIMEOUT = 60 * 5
+
+# Число постов в лентах Atom и JSON Feed
+POSTS_FEED_ITEMS = 50
+
+# Входит в ETag страниц постов: смена значения при выкладке новых
+# шаблонов не дает браузерам и CDN получать 304 со старой разметкой
+POSTS_ETAG_RELEASE = os.getenv('YATUBE_RELEASE', '1')
+
+# ASGI (yatube/asgi.py): размер пула потоков, в котором выполняются
+# запросы, и страницы, которые анонимам отдаются из кэша без потока.
+# Значения — функции ETag, по которым проверяется свежесть страницы
+ASGI_THREADS = int(os.getenv('YATUBE_ASGI_THREADS', 8))
+ASGI_CACHED_VIEWS = {
+    'posts:index': 'posts.etags.index_etag',
+    'posts:group_list': 'posts.etags.group_etag',
+    'posts:profile': 'posts.etags.profile_etag',
+    'posts:post_detail': 'posts.etags.post_etag',
 }
+ASGI_PAGE_CACHE_TIMEOUT = 60 * 60
+# Предел тела запроса в ASGI: картинка поста и поля формы без файлов.
+# Больший запрос получает 413, не дочитываясь до конца
+ASGI_MAX_BODY_SIZE = POSTS_IMAGE_MAX_BYTES + DATA_UPLOAD_MAX_MEMORY_SIZE
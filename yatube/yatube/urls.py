@@ -13,6 +13,7 @@ urlpatterns = [
     path('auth/', include('django.contrib.auth.urls')),
     path('', include('posts.urls', namespace='posts')),
     path('about/', include('about.urls', namespace='about')),
+    path('debug/', include('core.urls', namespace='core')),
 ]
 if settings.DEBUG:
     urlpatterns += static(